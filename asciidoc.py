@@ -7,6 +7,23 @@ under the terms of the GNU General Public License (GPL).
 """
 
 import sys, os, re, time, traceback, tempfile, subprocess, codecs, locale, unicodedata, copy
+import sre_parse
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5  # Python 2.4.
+try:
+    import threading
+except ImportError:
+    import dummy_threading as threading
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
 
 ### Used by asciidocapi.py ###
 VERSION = '8.6.9'           # See CHANGLOG file for version history.
@@ -174,15 +191,20 @@ class Message:
         # argument. Has no effect when set to None.
         self.linenos = None
         self.messages = []
+        # Structured (severity, file name, line number, text) tuples of the
+        # warning and error messages.
+        self.records = []
         self.prev_msg = ''
 
     def stdout(self,msg):
         print msg
 
-    def stderr(self,msg=''):
+    def stderr(self,msg='',record=None):
         if msg == self.prev_msg:  # Suppress repeated messages.
             return
         self.messages.append(msg)
+        if record is not None:
+            self.records.append(record)
         if __name__ == '__main__':
             sys.stderr.write('%s: %s%s' % (self.PROG, msg, os.linesep))
         self.prev_msg = msg
@@ -193,22 +215,37 @@ class Message:
             self.stderr(msg)
 
     def warning(self, msg,linenos=True,offset=0):
+        record = self.record('WARNING',msg,linenos,offset=offset)
         msg = self.format(msg,'WARNING: ',linenos,offset=offset)
         document.has_warnings = True
-        self.stderr(msg)
+        self.stderr(msg,record)
 
     def deprecated(self, msg, linenos=True):
+        record = self.record('DEPRECATED',msg,linenos)
         msg = self.format(msg, 'DEPRECATED: ', linenos)
-        self.stderr(msg)
+        self.stderr(msg,record)
 
-    def format(self, msg, prefix='', linenos=True, cursor=None, offset=0):
-        """Return formatted message string."""
+    def location(self, linenos=True, cursor=None, offset=0):
+        """Return message (file name, line number) tuple or None."""
         if self.linenos is not False and ((linenos or self.linenos) and reader.cursor):
             if cursor is None:
                 cursor = reader.cursor
-            prefix += '%s: line %d: ' % (os.path.basename(cursor[0]),cursor[1]+offset)
+            return (cursor[0],cursor[1]+offset)
+        return None
+
+    def format(self, msg, prefix='', linenos=True, cursor=None, offset=0):
+        """Return formatted message string."""
+        location = self.location(linenos,cursor,offset)
+        if location:
+            prefix += '%s: line %d: ' % (os.path.basename(location[0]),location[1])
         return prefix + msg
 
+    def record(self, severity, msg, linenos=True, cursor=None, offset=0):
+        """Return structured (severity, file name, line number, text)
+        message tuple."""
+        fname,lineno = self.location(linenos,cursor,offset) or (None,None)
+        return (severity,fname,lineno,msg)
+
     def error(self, msg, cursor=None, halt=False):
         """
         Report fatal error.
@@ -219,8 +256,9 @@ class Message:
         if halt:
             raise EAsciiDoc, self.format(msg,linenos=False,cursor=cursor)
         else:
+            record = self.record('ERROR',msg,cursor=cursor)
             msg = self.format(msg,'ERROR: ',cursor=cursor)
-            self.stderr(msg)
+            self.stderr(msg,record)
             document.has_errors = True
 
     def unsafe(self, msg):
@@ -244,13 +282,14 @@ def localapp():
     return os.path.isfile(os.path.join(APP_DIR, 'asciidoc.conf'))
 
 def file_in(fname, directory):
-    """Return True if file fname resides inside directory."""
-    assert os.path.isfile(fname)
+    """Return True if file fname resides inside directory (False if
+    directory does not exist)."""
     # Empty directory (not to be confused with None) is the current directory.
     if directory == '':
         directory = os.getcwd()
+    elif not os.path.isdir(directory):
+        return False
     else:
-        assert os.path.isdir(directory)
         directory = os.path.realpath(directory)
     fname = os.path.realpath(fname)
     return os.path.commonprefix((directory, fname)) == directory
@@ -258,6 +297,38 @@ def file_in(fname, directory):
 def safe():
     return document.safe
 
+def eval_literal(s):
+    """
+    Evaluate Python expression s which may only contain literals,
+    comparison and boolean operators. Raises ValueError if s contains
+    anything else (e.g. names, calls or attribute references).
+
+    >>> eval_literal('"html5" in ("html5","xhtml11") and not 1 > 2')
+    True
+    >>> eval_literal('True'), eval_literal('False'), eval_literal('None')
+    (True, False, None)
+    >>> eval_literal('(1 == 1) == True and None is None')
+    True
+    >>> eval_literal('__import__("os")')
+    Traceback (most recent call last):
+    ValueError: illegal expression: __import__("os")
+    """
+    try:
+        import ast
+    except ImportError:
+        raise ValueError,'expression evaluation requires Python 2.6 or later'
+    allowed = (ast.Expression, ast.Compare, ast.BoolOp, ast.UnaryOp,
+               ast.cmpop, ast.boolop, ast.unaryop, ast.expr_context,
+               ast.Str, ast.Num, ast.Tuple, ast.List)
+    tree = ast.parse(s.strip(), mode='eval')
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in ('True','False','None'):
+            continue
+        if not isinstance(node, allowed):
+            raise ValueError,'illegal expression: %s' % s
+    return eval(compile(tree, '<ifeval>', 'eval'),
+                {'__builtins__': {}, 'True': True, 'False': False, 'None': None})
+
 def is_safe_file(fname, directory=None):
     # A safe file must reside in 'directory' (defaults to the source
     # file directory).
@@ -307,6 +378,126 @@ def is_re(s):
     except: return False
     else: return True
 
+# Regular expressions that can't be combined into a single alternation:
+# numbered and named back references, conditional groups, inline flags
+# (other than leading flags) and named groups preceded by a backslash
+# (which may or may not be escaped).
+RE_UNCOMBINABLE = re.compile(
+    r'\\[1-9]|\(\?P=|\(\?\(|\(\?[iLmsux]+\)|\\\(\?P<')
+RE_LEADING_FLAGS = re.compile(r'(\(\?[iLmsux]+\))*')
+RE_CATEGORIES = re.compile(r'\\[wWbBdDsS]')   # Affected by (?u) and (?L).
+RE_MAX_GROUPS = 100     # Python re module limit.
+
+def re_alternation(relist):
+    """Combine list of regular expressions into a list of (reo,branches)
+    tuples for re_alternation_match(). Consecutive regular expressions are
+    joined into a single alternation 'reo' with a numbered group per
+    regular expression and 'branches' maps the group number to the
+    regular expression's index in 'relist'. Regular expressions that can't
+    be combined are compiled on their own and 'branches' is their index.
+
+    Named groups are made non-capturing so shared names don't clash:
+
+    >>> alt = re_alternation([r'(?P<x>a+)(?P<y>b)', r'(?P<x>c)(?P<z>d)?',
+    ...                       r'(a)\\1'])
+    >>> [(reo.pattern,branches) for reo,branches in alt]
+    [('((?:a+)(?:b))|((?:c)(?:d)?)', {1: 0, 2: 1}), ('(a)\\\\1', 2)]
+
+    Leading flags are hoisted, patterns with different flags, verbose
+    patterns and patterns with inline flags elsewhere are not combined:
+
+    >>> alt = re_alternation([r'(?s)a.', r'(?s)b.', r'c.', r'(?x)d # e',
+    ...                       r'f(?i)'])
+    >>> [(reo.pattern,reo.flags & re.DOTALL,branches) for reo,branches in alt]
+    [('(a.)|(b.)', 16, {1: 0, 2: 1}), ('(c.)', 0, {1: 2}), ('(?x)d # e', 0, 3), ('f(?i)', 0, 4)]
+
+    A named group after an escaped backslash or in a character class is
+    not rewritten:
+
+    >>> [branches for reo,branches in re_alternation([r'\\\\(?P<a>x)',
+    ...                                                r'[(?P<b>]y'])]
+    [0, 1]
+
+    A new alternation is started before the re module's 100 group limit:
+
+    >>> alt = re_alternation(['(x)'*60, '(y)'*60])
+    >>> [branches for reo,branches in alt]
+    [{1: 0}, {1: 1}]
+    """
+    chunks = []
+    chunk = None    # [flags,categories,alternatives,branches,next group].
+    for i,s in enumerate(relist):
+        reo = re.compile(s)
+        body = s[RE_LEADING_FLAGS.match(s).end():]
+        groups = None
+        # Verbose patterns can end with a comment.
+        if not reo.flags & re.VERBOSE and not RE_UNCOMBINABLE.search(body):
+            # Named groups would clash so make them non-capturing.
+            body,n = re.subn(r'\(\?P<\w+>', '(?:', body)
+            try:
+                groups = re.compile(body, reo.flags).groups
+            except Exception:
+                pass
+            # Check only the named groups were changed (e.g. not a '(?P<'
+            # in a character class).
+            if n != len(reo.groupindex) or groups != reo.groups - n:
+                groups = None
+        if groups is None:
+            chunks.append((reo,i))
+            chunk = None
+            continue
+        flags = reo.flags
+        categories = RE_CATEGORIES.search(body) is not None
+        if chunk is not None and flags != chunk[0]:
+            # The unicode and locale flags only affect character categories.
+            lu = re.UNICODE | re.LOCALE
+            if flags & ~lu != chunk[0] & ~lu:
+                chunk = None
+            elif not categories:
+                flags = chunk[0]
+            elif not chunk[1]:
+                chunk[0] = flags
+            else:
+                chunk = None
+        if chunk is not None and chunk[4] + groups >= RE_MAX_GROUPS:
+            chunk = None
+        if chunk is None:
+            chunk = [flags,False,[],{},1]
+            chunks.append(chunk)
+        chunk[1] = chunk[1] or categories
+        chunk[2].append('(' + body + ')')
+        chunk[3][chunk[4]] = i
+        chunk[4] += 1 + groups
+    result = []
+    for chunk in chunks:
+        if isinstance(chunk,list):
+            chunk = (re.compile('|'.join(chunk[2]), chunk[0]), chunk[3])
+        result.append(chunk)
+    return result
+
+def re_alternation_match(alternation, s):
+    """Return (mo,i) tuple where 'i' is the index of the first regular
+    expression combined by re_alternation() that matches the start of
+    string 's' and 'mo' is the combined match object. Return (None,None) if
+    there is no match.
+
+    >>> alt = re_alternation([r'(?P<x>a)', r'(?P<x>a)b', r'(?P<y>c)(d)'])
+    >>> mo,i = re_alternation_match(alt, 'cd')
+    >>> i, mo.group(mo.lastindex)
+    (2, 'cd')
+    >>> re_alternation_match(alt, 'ab')[1]  # First match wins.
+    0
+    >>> re_alternation_match(alt, 'x')
+    (None, None)
+    """
+    for reo,branches in alternation:
+        mo = reo.match(s)
+        if mo:
+            if isinstance(branches,int):
+                return (mo,branches)
+            return (mo,branches[mo.lastindex])
+    return (None,None)
+
 def re_join(relist):
     """Join list of regular expressions re1,re2,... to single regular
     expression (re1)|(re2)|..."""
@@ -320,6 +511,123 @@ def re_join(relist):
     result = '('+result+')'
     return result
 
+def re_literal(s):
+    """Return the longest string that every match of regular expression 's'
+    must contain, '' if there isn't one. Used to skip regular expression
+    searches that can't succeed.
+
+    >>> re_literal(r'^(?P<name>\\w+)::(?P<target>\\S*?)\\[')
+    '::'
+    >>> re_literal(r'a\\.b+c')    # Escaped and repeated literals.
+    'a.'
+    >>> re_literal(r'x*y?'), re_literal(r'(?i)abc')
+    ('', '')
+    """
+    def longest(items):
+        result = ''
+        run = []
+        for op,av in list(items) + [(None,None)]:
+            if op == sre_parse.LITERAL and av < 256:
+                run.append(chr(av))
+                continue
+            if len(run) > len(result):
+                result = ''.join(run)
+            run = []
+            if op == sre_parse.SUBPATTERN:
+                t = longest(av[-1])
+            elif op in (sre_parse.MAX_REPEAT,sre_parse.MIN_REPEAT) \
+                    and av[0] >= 1:
+                t = longest(av[2])
+            else:
+                continue
+            if len(t) > len(result):
+                result = t
+        return result
+    try:
+        p = sre_parse.parse(s)
+    except Exception:
+        return ''
+    if p.pattern.flags & sre_parse.SRE_FLAG_IGNORECASE:
+        return ''
+    return longest(p)
+
+def re_first_chars(s):
+    """Return string of the characters that a match of regular expression
+    's' can start with, None if a match can start with any character or
+    can be empty. Used to skip regular expression matches that can't
+    succeed.
+
+    >>> re_first_chars(r'^(?P<a>[=-]+)$')
+    '=-'
+    >>> re_first_chars(r'NOTE|TIP|(?:IMP)'), re_first_chars(r'(?:x|)y')
+    ('NTI', 'xy')
+    >>> re_first_chars(r'a*b'), re_first_chars(r'\\d+\\.')
+    ('ab', '0123456789')
+    >>> print re_first_chars(r'a*'), re_first_chars(r'.+'), \\
+    ...     re_first_chars(r'(?i)a')
+    None None None
+    """
+    try:
+        p = sre_parse.parse(s)
+    except Exception:
+        return None
+    flags = p.pattern.flags
+    if flags & (sre_parse.SRE_FLAG_IGNORECASE | sre_parse.SRE_FLAG_LOCALE):
+        return None
+    spaces = ' \t\n\r\f\v'
+    if flags & sre_parse.SRE_FLAG_UNICODE:
+        spaces += '\x1c\x1d\x1e\x1f\x85\xa0'
+    categories = {sre_parse.CATEGORY_SPACE: spaces,
+                  sre_parse.CATEGORY_DIGIT: '0123456789'}
+    def first(items):
+        """Return (chars,nullable) tuple for sequence of parsed items."""
+        result = ''
+        for op,av in items:
+            nullable = False
+            if op == sre_parse.LITERAL:
+                if av > 255: return None
+                chars = chr(av)
+            elif op == sre_parse.IN:
+                chars = ''
+                for op2,av2 in av:
+                    if op2 == sre_parse.LITERAL and av2 < 256:
+                        chars += chr(av2)
+                    elif op2 == sre_parse.RANGE and av2[1] < 256:
+                        chars += ''.join(map(chr, range(av2[0],av2[1]+1)))
+                    elif op2 == sre_parse.CATEGORY and av2 in categories:
+                        chars += categories[av2]
+                    else:
+                        return None
+            elif op == sre_parse.AT:
+                chars = ''
+                nullable = True
+            elif op == sre_parse.SUBPATTERN:
+                t = first(av[-1])
+                if t is None: return None
+                chars,nullable = t
+            elif op == sre_parse.BRANCH:
+                chars = ''
+                for branch in av[1]:
+                    t = first(branch)
+                    if t is None: return None
+                    chars += t[0]
+                    nullable = nullable or t[1]
+            elif op in (sre_parse.MAX_REPEAT,sre_parse.MIN_REPEAT):
+                t = first(av[2])
+                if t is None: return None
+                chars = t[0]
+                nullable = t[1] or av[0] == 0
+            else:
+                return None
+            result += chars
+            if not nullable:
+                return (result,False)
+        return (result,True)
+    t = first(p)
+    if t is None or t[1]:
+        return None
+    return t[0]
+
 def lstrip_list(s):
     """
     Return list with empty items from start of list removed.
@@ -575,46 +883,39 @@ def is_name(s):
 def subs_quotes(text):
     """Quoted text is marked up and the resulting text is
     returned."""
-    keys = config.quotes.keys()
-    for q in keys:
-        i = q.find('|')
-        if i != -1 and q != '|' and q != '||':
-            lq = q[:i]      # Left quote.
-            rq = q[i+1:]    # Right quote.
-        else:
-            lq = rq = q
-        tag = config.quotes[q]
-        if not tag: continue
-        # Unconstrained quotes prefix the tag name with a hash.
-        if tag[0] == '#':
-            tag = tag[1:]
-            # Unconstrained quotes can appear anywhere.
-            reo = re.compile(r'(?msu)(^|.)(\[(?P<attrlist>[^[\]]+?)\])?' \
-                    + r'(?:' + re.escape(lq) + r')' \
-                    + r'(?P<content>.+?)(?:'+re.escape(rq)+r')')
-        else:
-            # The text within constrained quotes must be bounded by white space.
-            # Non-word (\W) characters are allowed at boundaries to accomodate
-            # enveloping quotes and punctuation e.g. a='x', ('x'), 'x', ['x'].
-            reo = re.compile(r'(?msu)(^|[^\w;:}])(\[(?P<attrlist>[^[\]]+?)\])?' \
-                + r'(?:' + re.escape(lq) + r')' \
-                + r'(?P<content>\S|\S.*?\S)(?:'+re.escape(rq)+r')(?=\W|$)')
+    for lq,reo,tag in config.compile_quotes():
+        if lq not in text: continue
+        result = []     # Substituted text fragments.
+        start = 0       # Start of text not yet copied to result.
         pos = 0
         while True:
             mo = reo.search(text,pos)
             if not mo: break
             if text[mo.start()] == '\\':
                 # Delete leading backslash.
-                text = text[:mo.start()] + text[mo.start()+1:]
+                result.append(text[start:mo.start()])
+                start = mo.start() + 1
                 # Skip past start of match.
-                pos = mo.start() + 1
+                pos = mo.start() + 2
             else:
                 attrlist = {}
                 parse_attributes(mo.group('attrlist'), attrlist)
                 stag,etag = config.tag(tag, attrlist)
                 s = mo.group(1) + stag + mo.group('content') + etag
-                text = text[:mo.start()] + s + text[mo.end():]
-                pos = mo.start() + len(s)
+                result.append(text[start:mo.start()])
+                result.append(s)
+                start = pos = mo.end()
+                if (s[-1:] == '\n') != (text[pos-1] == '\n'):
+                    # A ^ following the substitution would match differently
+                    # in the original text, so continue with substituted text.
+                    tail = text[pos:]
+                    text = ''.join(result) + tail
+                    pos = len(text) - len(tail)
+                    result = []
+                    start = 0
+        if result:
+            result.append(text[start:])
+            text = ''.join(result)
     return text
 
 def subs_tag(tag,dict={}):
@@ -803,13 +1104,20 @@ def filter_lines(filter_cmd, lines, attrs={}):
             message.warning('filter not found: %s' % cmd)
     if found:
         filter_cmd = '"' + found + '"' + mo.group('tail')
+        document.depend(found)
     if found:
         if cmd.endswith('.py'):
             filter_cmd = '"%s" %s' % (document.attributes['python'],
                 filter_cmd)
         elif cmd.endswith('.rb'):
             filter_cmd = 'ruby ' + filter_cmd
-
+    cache = None
+    if FilterCache.enabled() and FilterCache.cacheable(filter_cmd):
+        cache = FilterCache.path(filter_cmd, found or cmd, lines)
+        result = FilterCache.get(cache)
+        if result is not None:
+            message.verbose('filtering: %s (cached)' % filter_cmd)
+            return result
     message.verbose('filtering: ' + filter_cmd)
     if os.name == 'nt':
         # Remove redundant quoting -- this is not just
@@ -832,6 +1140,8 @@ def filter_lines(filter_cmd, lines, attrs={}):
                (filter_cmd, filter_status))
     if lines and not result:
         message.warning('no output from filter: %s' % filter_cmd)
+    elif cache and not filter_status:
+        FilterCache.put(cache, result)
     return result
 
 def system(name, args, is_macro=False, attrs=None):
@@ -972,11 +1282,7 @@ def system(name, args, is_macro=False, attrs=None):
         elif not is_safe_file(args):
             message.unsafe(syntax)
         else:
-            f = open(args)
-            try:
-                result = [s.rstrip() for s in f]
-            finally:
-                f.close()
+            result = IncludeCache.readlines(args)
             if result:
                 result = subs_attrs(result)
                 result = separator.join(result)
@@ -1002,6 +1308,150 @@ def system(name, args, is_macro=False, attrs=None):
         result = '\x07' + str(len(macros.passthroughs)-1) + '\x07'
     return result
 
+# Precompiled subs_attrs() regular expressions.
+# Simple attribute reference: {name}
+SUBS_ATTRS_SIMPLE_RE = re.compile(r'(?su)\{(?P<name>[^\\\W][-\w]*?)\}(?!\\)')
+# Conditional attribute reference, single name -- higher precedence.
+SUBS_ATTRS_COND1_RE = re.compile(r'(?su)\{(?P<name>[^\\\W][-\w]*?)' \
+                                 r'(?P<op>\=|\?|!|#|%|@|\$)' \
+                                 r'(?P<value>.*?)\}(?!\\)')
+# Conditional attribute reference, multiple names (n1,n2,... or n1+n2+...)
+# -- lower precedence.
+SUBS_ATTRS_COND2_RE = re.compile(r'(?su)\{(?P<name>[^\\\W][-\w'+OR+AND+r']*?)' \
+                                 r'(?P<op>\=|\?|!|#|%|@|\$)' \
+                                 r'(?P<value>.*?)\}(?!\\)')
+SUBS_ATTRS_NAME_RE = re.compile(r'^[^\\\W][-\w]*$')
+# System attribute references (eval has precedence).
+SUBS_ATTRS_SYS_RES = (
+    re.compile(r'(?su)\{(?P<action>eval):(?P<expr>.*?)\}(?!\\)'),
+    re.compile(r'(?su)\{(?P<action>[^\\\W][-\w]*?):(?P<expr>.*?)\}(?!\\)'),
+)
+SUBS_ATTRS_NUMBER_RE = re.compile(r'^\d+$')
+SUBS_ATTRS_SPLIT_RE = re.compile(r'(?<!\\):')
+
+SUBS_ATTRS_UNDEFINED = '{zzzzz}'    # Conditional value that drops the line.
+
+def subs_attrs_cond(op, lval, rval, attr):
+    """Return the substitution for conditional attribute reference attr
+    with operator op. lval is the attribute value (None if undefined), rval
+    is the reference value."""
+    if lval is None:
+        if op == '=': s = rval
+        elif op == '?': s = ''
+        elif op == '!': s = rval
+        elif op == '#': s = SUBS_ATTRS_UNDEFINED   # So the line is dropped.
+        elif op == '%': s = rval
+        elif op in ('@','$'):
+            s = SUBS_ATTRS_UNDEFINED               # So the line is dropped.
+        else:
+            assert False, 'illegal attribute: %s' % attr
+    else:
+        if op == '=': s = lval
+        elif op == '?': s = rval
+        elif op == '!': s = ''
+        elif op == '#': s = rval
+        elif op == '%': s = SUBS_ATTRS_UNDEFINED   # So the line is dropped.
+        elif op in ('@','$'):
+            v = SUBS_ATTRS_SPLIT_RE.split(rval)
+            if len(v) not in (2,3):
+                message.error('illegal attribute syntax: %s' % attr)
+                s = ''
+            elif not is_re('^'+v[0]+'$'):
+                message.error('illegal attribute regexp: %s' % attr)
+                s = ''
+            else:
+                v = [s.replace('\\:',':') for s in v]
+                re_mo = re.match('^'+v[0]+'$',lval)
+                if op == '@':
+                    if re_mo:
+                        s = v[1]         # {<name>@<re>:<v1>[:<v2>]}
+                    else:
+                        if len(v) == 3:   # {<name>@<re>:<v1>:<v2>}
+                            s = v[2]
+                        else:             # {<name>@<re>:<v1>}
+                            s = ''
+                else:
+                    if re_mo:
+                        if len(v) == 2:   # {<name>$<re>:<v1>}
+                            s = v[1]
+                        elif v[1] == '':  # {<name>$<re>::<v2>}
+                            s = SUBS_ATTRS_UNDEFINED # So the line is dropped.
+                        else:             # {<name>$<re>:<v1>:<v2>}
+                            s = v[1]
+                    else:
+                        if len(v) == 2:   # {<name>$<re>:<v1>}
+                            s = SUBS_ATTRS_UNDEFINED # So the line is dropped.
+                        else:             # {<name>$<re>:<v1>:<v2>}
+                            s = v[2]
+        else:
+            assert False, 'illegal attribute: %s' % attr
+    return str(s)
+
+# Simple {name} or single name conditional {name<op><value>} attribute
+# reference without nested braces or backslashes.
+SUBS_ATTRS_TOKEN_RE = re.compile(r'(?su)\{([^\\\W][-\w]*)(?:([=?!#%@$])([^{}\\]*))?\}')
+
+subs_attrs_tokens_cache = {} # Memoized subs_attrs_tokenize() results.
+
+def subs_attrs_tokenize(line):
+    """
+    Return the [text,name,op,value,text,...,text] token list for line or
+    False if the line contains escaped, nested, multiple name or system
+    attribute references. op and value are None for simple references.
+    Results are memoized (the same template lines are substituted
+    repeatedly).
+    """
+    result = subs_attrs_tokens_cache.get(line)
+    if result is None:
+        result = False
+        if '\\' not in line:
+            tokens = SUBS_ATTRS_TOKEN_RE.split(line)
+            for text in tokens[::4]:
+                if '{' in text or '}' in text:
+                    break
+            else:
+                result = tokens
+        if len(subs_attrs_tokens_cache) >= 10000:
+            subs_attrs_tokens_cache.clear()
+        subs_attrs_tokens_cache[line] = result
+    return result
+
+def subs_attrs_tokens(line, attrs):
+    """
+    Substitute the simple and single name conditional attribute references
+    in line in a single pass. Return the substituted line, None if the line
+    is dropped, or False if the line can't be tokenized (see
+    subs_attrs_tokenize()) or a substituted value contains braces -- these
+    lines are processed by the subs_attrs() multi-pass engine.
+    """
+    tokens = subs_attrs_tokenize(line)
+    if tokens is False:
+        return False
+    result = [tokens[0]]
+    dropped = False
+    for i in range(1,len(tokens),4):
+        name,op,value = tokens[i:i+3]
+        lval = attrs.get(name)
+        if op is None:
+            if lval is None:
+                dropped = True
+                s = '{%s}' % name
+            else:
+                s = str(lval)
+        else:
+            s = subs_attrs_cond(op,lval,value,'{%s%s%s}' % (name,op,value))
+            if s == SUBS_ATTRS_UNDEFINED:
+                dropped = True
+        if '{' in s or '}' in s or '\\' in s:
+            return False
+        result.append(s)
+        result.append(tokens[i+3])
+    result = ''.join(result)
+    if dropped:
+        trace('dropped line', result)
+        return None
+    return result
+
 def subs_attrs(lines, dictionary=None):
     """Substitute 'lines' of text with attributes from the global
     document.attributes dictionary and from 'dictionary' ('dictionary'
@@ -1034,15 +1484,23 @@ def subs_attrs(lines, dictionary=None):
         lines = [lines]
     else:
         string_result = False
+    # Fast path: lines without attribute references.
+    has_refs = False
+    for line in lines:
+        if '{' in line:
+            has_refs = True
+            break
     if dictionary is None:
         attrs = document.attributes
     else:
         # Remove numbered document attributes so they don't clash with
         # attribute list positional attributes.
         attrs = {}
-        for k,v in document.attributes.items():
-            if not re.match(r'^\d+$', k):
-                attrs[k] = v
+        if has_refs:
+            attrs.update(document.attributes)
+            for k in [k for k in attrs if k[:1].isdigit()]:
+                if SUBS_ATTRS_NUMBER_RE.match(k):
+                    del attrs[k]
         # Substitute attribute references inside dictionary values.
         for k,v in dictionary.items():
             if v is None:
@@ -1057,12 +1515,24 @@ def subs_attrs(lines, dictionary=None):
     # Substitute all attributes in all lines.
     result = []
     for line in lines:
+        if '{' not in line:
+            # Only escaped closing braces need processing.
+            if '}' in line:
+                line = line.replace('\\}','}\\')
+                line = line.replace('}\\','}')
+            result.append(line)
+            continue
+        s = subs_attrs_tokens(line,attrs)
+        if s is not False:
+            if s is not None:
+                result.append(s)
+            continue
         # Make it easier for regular expressions.
         line = line.replace('\\{','{\\')
         line = line.replace('\\}','}\\')
         # Expand simple attributes ({name}).
         # Nested attributes not allowed.
-        reo = re.compile(r'(?su)\{(?P<name>[^\\\W][-\w]*?)\}(?!\\)')
+        reo = SUBS_ATTRS_SIMPLE_RE
         pos = 0
         while True:
             mo = reo.search(line,pos)
@@ -1075,14 +1545,8 @@ def subs_attrs(lines, dictionary=None):
                 line = line[:mo.start()] + s + line[mo.end():]
                 pos = mo.start() + len(s)
         # Expand conditional attributes.
-        # Single name -- higher precedence.
-        reo1 = re.compile(r'(?su)\{(?P<name>[^\\\W][-\w]*?)' \
-                          r'(?P<op>\=|\?|!|#|%|@|\$)' \
-                          r'(?P<value>.*?)\}(?!\\)')
-        # Multiple names (n1,n2,... or n1+n2+...) -- lower precedence.
-        reo2 = re.compile(r'(?su)\{(?P<name>[^\\\W][-\w'+OR+AND+r']*?)' \
-                          r'(?P<op>\=|\?|!|#|%|@|\$)' \
-                          r'(?P<value>.*?)\}(?!\\)')
+        reo1 = SUBS_ATTRS_COND1_RE
+        reo2 = SUBS_ATTRS_COND2_RE
         for reo in [reo1,reo2]:
             pos = 0
             while True:
@@ -1097,7 +1561,7 @@ def subs_attrs(lines, dictionary=None):
                         sep = AND
                     names = [s.strip() for s in name.split(sep) if s.strip() ]
                     for n in names:
-                        if not re.match(r'^[^\\\W][-\w]*$',n):
+                        if not SUBS_ATTRS_NAME_RE.match(n):
                             message.error('illegal attribute syntax: %s' % attr)
                     if sep == OR:
                         # Process OR name expression: n1,n2,...
@@ -1121,72 +1585,17 @@ def subs_attrs(lines, dictionary=None):
                 # mo.end() not good enough because '{x={y}}' matches '{x={y}'.
                 end = end_brace(line,mo.start())
                 rval = line[mo.start('value'):end-1]
-                UNDEFINED = '{zzzzz}'
-                if lval is None:
-                    if op == '=': s = rval
-                    elif op == '?': s = ''
-                    elif op == '!': s = rval
-                    elif op == '#': s = UNDEFINED   # So the line is dropped.
-                    elif op == '%': s = rval
-                    elif op in ('@','$'):
-                        s = UNDEFINED               # So the line is dropped.
-                    else:
-                        assert False, 'illegal attribute: %s' % attr
-                else:
-                    if op == '=': s = lval
-                    elif op == '?': s = rval
-                    elif op == '!': s = ''
-                    elif op == '#': s = rval
-                    elif op == '%': s = UNDEFINED   # So the line is dropped.
-                    elif op in ('@','$'):
-                        v = re.split(r'(?<!\\):',rval)
-                        if len(v) not in (2,3):
-                            message.error('illegal attribute syntax: %s' % attr)
-                            s = ''
-                        elif not is_re('^'+v[0]+'$'):
-                            message.error('illegal attribute regexp: %s' % attr)
-                            s = ''
-                        else:
-                            v = [s.replace('\\:',':') for s in v]
-                            re_mo = re.match('^'+v[0]+'$',lval)
-                            if op == '@':
-                                if re_mo:
-                                    s = v[1]         # {<name>@<re>:<v1>[:<v2>]}
-                                else:
-                                    if len(v) == 3:   # {<name>@<re>:<v1>:<v2>}
-                                        s = v[2]
-                                    else:             # {<name>@<re>:<v1>}
-                                        s = ''
-                            else:
-                                if re_mo:
-                                    if len(v) == 2:   # {<name>$<re>:<v1>}
-                                        s = v[1]
-                                    elif v[1] == '':  # {<name>$<re>::<v2>}
-                                        s = UNDEFINED # So the line is dropped.
-                                    else:             # {<name>$<re>:<v1>:<v2>}
-                                        s = v[1]
-                                else:
-                                    if len(v) == 2:   # {<name>$<re>:<v1>}
-                                        s = UNDEFINED # So the line is dropped.
-                                    else:             # {<name>$<re>:<v1>:<v2>}
-                                        s = v[2]
-                    else:
-                        assert False, 'illegal attribute: %s' % attr
-                s = str(s)
+                s = subs_attrs_cond(op,lval,rval,attr)
                 line = line[:mo.start()] + s + line[end:]
                 pos = mo.start() + len(s)
         # Drop line if it contains  unsubstituted {name} references.
-        skipped = re.search(r'(?su)\{[^\\\W][-\w]*?\}(?!\\)', line)
+        skipped = SUBS_ATTRS_SIMPLE_RE.search(line)
         if skipped:
             trace('dropped line', line)
             continue;
         # Expand system attributes (eval has precedence).
-        reos = [
-            re.compile(r'(?su)\{(?P<action>eval):(?P<expr>.*?)\}(?!\\)'),
-            re.compile(r'(?su)\{(?P<action>[^\\\W][-\w]*?):(?P<expr>.*?)\}(?!\\)'),
-        ]
         skipped = False
-        for reo in reos:
+        for reo in SUBS_ATTRS_SYS_RES:
             pos = 0
             while True:
                 mo = reo.search(line,pos)
@@ -1448,6 +1857,20 @@ class Document(object):
         self.has_errors = False # Set true if processing errors were flagged.
         self.has_warnings = False # Set true if warnings were flagged.
         self.safe = False       # Default safe mode.
+        self.deps = None        # If not None a list of the files the output
+                                # file depends on (see --deps option).
+        self.missing = []       # Dependencies that were looked for but
+                                # not found.
+    def depend(self,fname,found=True):
+        """Record file fname as an output file dependency. If found is False
+        the file was looked for but does not exist."""
+        if self.deps is not None:
+            fname = os.path.abspath(fname)
+            if not found:
+                if fname not in self.missing:
+                    self.missing.append(fname)
+            elif fname not in self.deps:
+                self.deps.append(fname)
     def update_attributes(self,attrs=None):
         """
         Set implicit attributes and attributes in 'attrs'.
@@ -1876,6 +2299,7 @@ class AttributeEntry:
             else:
                 # Markup template section attribute.
                 config.sections[attr.name] = [attr.value]
+                config.templates.pop(attr.name, None)
         else:
             # Normal attribute.
             if attr.name[-1] == '!':
@@ -2537,7 +2961,7 @@ class AbstractBlock:
         if not self.presubs:
             self.presubs = config.subsnormal
         if reader.cursor:
-            self.start = reader.cursor[:]
+            self.start = reader.cursor
     def push_blockname(self, blockname=None):
         '''
         On block entry set the 'blockname' attribute.
@@ -2652,8 +3076,11 @@ class AbstractBlocks:
         self.blocks = []        # List of Block objects.
         self.default = None     # Default Block.
         self.delimiters = None  # Combined delimiters regular expression.
+        self.index = None       # Candidate blocks keyed by first character.
+        self.alternations = {}  # Combined self.index delimiters.
     def load(self,sections):
         """Load block definition from 'sections' dictionary."""
+        self.index = None
         for k in sections.keys():
             if re.match(r'^'+ self.PREFIX + r'.+$',k):
                 d = {}
@@ -2671,11 +3098,47 @@ class AbstractBlocks:
     def dump(self):
         for b in self.blocks:
             b.dump()
-    def isnext(self):
+    def build_index(self):
+        """Build self.index dictionary mapping the first character of a line
+        to the list of blocks whose delimiter can match a line starting with
+        that character. Blocks are in definition order, the None key lists
+        the blocks whose delimiter can start with any character."""
+        candidates = []
+        chars = {}
         for b in self.blocks:
+            first = re_first_chars(b.delimiter)
+            candidates.append((first,b))
+            if first is not None:
+                for c in first:
+                    chars[c] = True
+        self.index = {}
+        self.index[None] = [b for first,b in candidates if first is None]
+        for c in chars.keys():
+            self.index[c] = [b for first,b in candidates
+                                if first is None or c in first]
+        self.alternations = {}
+    def isnext(self):
+        reader.skip_blank_lines()
+        line = reader.read_next()
+        if not line:
+            return False
+        if self.index is None:
+            self.build_index()
+        c = line[0]
+        if c not in self.index:
+            c = None
+        # The combined delimiters of the candidate blocks are compiled on
+        # first use.
+        alternation = self.alternations.get(c)
+        if alternation is None:
+            alternation = re_alternation([b.delimiter for b in self.index[c]])
+            self.alternations[c] = alternation
+        mo,i = re_alternation_match(alternation, line)
+        if mo is not None:
+            b = self.index[c][i]
             if b.isnext():
                 self.current = b
-                return True;
+                return True
         return False
     def validate(self):
         """Validate the block definitions."""
@@ -2758,6 +3221,8 @@ class Paragraphs(AbstractBlocks):
                 break
         else:
             raise EAsciiDoc,'missing section: [paradef-default]'
+        # The index is positional, rebuild it on the next isnext().
+        self.index = None
 
 class List(AbstractBlock):
     NUMBER_STYLES= ('arabic','loweralpha','upperalpha','lowerroman',
@@ -3743,6 +4208,10 @@ class Macros:
         self.macros = []        # List of Macros.
         self.current = None     # The last matched block macro.
         self.passthroughs = []
+        self.alternation = None # Combined block macro patterns.
+        self.blockmacros = []   # Block macros in self.alternation order.
+        self.prefixes = None    # (literal,macro) lists keyed by macro prefix.
+        self.name_reos = {}     # Compiled match() macro name patterns.
         # Initialize default system macro.
         m = Macro()
         m.pattern = self.SYS_RE
@@ -3750,6 +4219,8 @@ class Macros:
         m.reo = re.compile(m.pattern)
         self.macros.append(m)
     def load(self,entries):
+        self.alternation = None
+        self.prefixes = None
         for entry in entries:
             m = Macro()
             m.load(entry)
@@ -3800,23 +4271,38 @@ class Macros:
         reader.skip_blank_lines()
         line = reader.read_next()
         if line:
-            for m in self.macros:
-                if m.prefix == '#':
-                    if m.reo.match(line):
-                        self.current = m
-                        return m
+            if self.alternation is None:
+                self.blockmacros = [m for m in self.macros if m.prefix == '#']
+                self.alternation = re_alternation(
+                        [m.pattern for m in self.blockmacros])
+            mo,i = re_alternation_match(self.alternation, line)
+            if mo is not None:
+                self.current = self.blockmacros[i]
+                return self.current
         return False
     def match(self,prefix,name,text):
         """Return re match object matching 'text' with macro type 'prefix',
         macro name 'name'."""
-        for m in self.macros:
-            if m.prefix == prefix:
-                mo = m.reo.match(text)
-                if mo:
-                    if m.name == name:
-                        return mo
-                    if re.match(name, mo.group('name')):
-                        return mo
+        if self.prefixes is None:
+            # Index macros by prefix along with the literal text that any
+            # match must contain e.g. system macros must contain '::'.
+            self.prefixes = {}
+            for m in self.macros:
+                self.prefixes.setdefault(m.prefix,[]).append(
+                        (re_literal(m.pattern),m))
+        for literal,m in self.prefixes.get(prefix,()):
+            if literal not in text:
+                continue
+            mo = m.reo.match(text)
+            if mo:
+                if m.name == name:
+                    return mo
+                reo = self.name_reos.get(name)
+                if reo is None:
+                    reo = re.compile(name)
+                    self.name_reos[name] = reo
+                if reo.match(mo.group('name')):
+                    return mo
         return None
     def extract_passthroughs(self,text,prefix=''):
         """ Extract the passthrough text and replace with temporary
@@ -3939,6 +4425,15 @@ class Macro:
             # The alt attribute is the first image macro positional attribute.
             if name == 'image' and '1' in d:
                 d['alt'] = d['1']
+            if name == 'image' and d.get('target') and \
+                    document.deps is not None:
+                # Record local image files as output file dependencies.
+                fname = os.path.join(
+                        document.attributes.get('indir') or
+                        document.attributes.get('outdir') or '',
+                        document.attributes.get('imagesdir',''),
+                        d['target'])
+                document.depend(fname, os.path.isfile(fname))
             # Unescape special characters in LaTeX target file names.
             if document.backend == 'latex' and 'target' in d and d['target']:
                 if not '0' in d:
@@ -4082,73 +4577,97 @@ class Reader1:
     conditional inclusion system macros. Tabs are expanded and lines are right
     trimmed."""
     # This class is not used directly, use Reader class instead.
-    READ_BUFFER_MIN = 10        # Read buffer low level.
     def __init__(self):
-        self.f = None           # Input file object.
+        self.f = None           # Input file object ('<stdin>' only).
         self.fname = None       # Input file name.
-        self.next = []          # Read ahead buffer containing
-                                # [filename,linenumber,linetext] lists.
-        self.cursor = None      # Last read() [filename,linenumber,linetext].
+        self.data = ''          # Input file contents.
+        self.pos = 0            # Offset of the next unread line in data.
+        self.lineno = 0         # Line number of the last line read from data.
+        self.next = []          # Stack of unread() (pushed back)
+                                # (filename,linenumber,linetext) tuples.
+        self.cursor = None      # Last read() (filename,linenumber,linetext).
         self.tabsize = 8        # Tab expansion number of spaces.
         self.parent = None      # Included reader's parent reader.
-        self._lineno = 0        # The last line read from file object f.
         self.current_depth = 0  # Current include depth.
         self.max_depth = 10     # Initial maxiumum allowed include depth.
         self.bom = None         # Byte order mark (BOM).
         self.infile = None      # Saved document 'infile' attribute.
         self.indir = None       # Saved document 'indir' attribute.
+        self.depends = None     # If not None a list that records the outcome
+                                # of system macros (see ConfigCache).
+        self.config = False     # True if reading a configuration file.
+        self.stdin = None       # '<stdin>' file object (default sys.stdin).
     def open(self,fname):
         self.fname = fname
         message.verbose('reading: '+fname)
         if fname == '<stdin>':
-            self.f = sys.stdin
+            self.f = self.stdin or sys.stdin
             self.infile = None
             self.indir = None
+            data = self.f.read()
         else:
-            self.f = open(fname,'rb')
+            # Read the whole file in one go, lines are sliced from it as they
+            # are read.
+            self.f = None
+            if self.parent:
+                # Include files are cached, they are often included more than
+                # once.
+                data = IncludeCache.read(fname)
+            else:
+                f = open(fname,'rb')
+                try:
+                    data = f.read()
+                finally:
+                    f.close()
             self.infile = fname
             self.indir = os.path.dirname(fname)
         document.attributes['infile'] = self.infile
         document.attributes['indir'] = self.indir
-        self._lineno = 0            # The last line read from file object f.
+        if data.startswith(UTF8_BOM):
+            data = data[len(UTF8_BOM):]
+            self.bom = UTF8_BOM
+        self.data = data
+        self.pos = 0
+        self.lineno = 0
         self.next = []
-        # Prefill buffer by reading the first line and then pushing it back.
-        if Reader1.read(self):
-            if self.cursor[2].startswith(UTF8_BOM):
-                self.cursor[2] = self.cursor[2][len(UTF8_BOM):]
-                self.bom = UTF8_BOM
-            self.unread(self.cursor)
-            self.cursor = None
     def closefile(self):
         """Used by class methods to close nested include files."""
-        self.f.close()
+        if self.f:
+            self.f.close()
+            self.f = None
+        self.data = ''
+        self.pos = 0
         self.next = []
     def close(self):
         self.closefile()
         self.__init__()
+    def depend(self, *args):
+        """Record the outcome of a system macro evaluation if the reader
+        is recording dependencies."""
+        if self.depends is not None:
+            self.depends.append(args)
+    def next_line(self):
+        """Return the (filename,linenumber,linetext) tuple of the next line
+        in the file data. Expand tabs. Strip trailing white space."""
+        i = self.data.find('\n',self.pos)
+        if i == -1:
+            i = len(self.data)
+        s = self.data[self.pos:i]
+        self.pos = i + 1
+        self.lineno = self.lineno + 1
+        if self.tabsize != 0 and '\t' in s:
+            s = s.expandtabs(self.tabsize)
+        return (self.fname,self.lineno,s.rstrip())
     def read(self, skip=False):
-        """Read next line. Return None if EOF. Expand tabs. Strip trailing
-        white space. Maintain self.next read ahead buffer. If skip=True then
-        conditional exclusion is active (ifdef and ifndef macros)."""
-        # Top up buffer.
-        if len(self.next) <= self.READ_BUFFER_MIN:
-            s = self.f.readline()
-            if s:
-                self._lineno = self._lineno + 1
-            while s:
-                if self.tabsize != 0:
-                    s = s.expandtabs(self.tabsize)
-                s = s.rstrip()
-                self.next.append([self.fname,self._lineno,s])
-                if len(self.next) > self.READ_BUFFER_MIN:
-                    break
-                s = self.f.readline()
-                if s:
-                    self._lineno = self._lineno + 1
-        # Return first (oldest) buffer entry.
-        if len(self.next) > 0:
-            self.cursor = self.next[0]
-            del self.next[0]
+        """Read next line. Return None if EOF. Lines pushed back by unread()
+        are returned first. If skip=True then conditional exclusion is active
+        (ifdef and ifndef macros)."""
+        # Return the last pushed back line else the next file line.
+        if self.next or self.pos < len(self.data):
+            if self.next:
+                self.cursor = self.next.pop()
+            else:
+                self.cursor = self.next_line()
             result = self.cursor[2]
             # Check for include macro.
             mo = macros.match('+',r'^include[1]?$',result)
@@ -4163,29 +4682,41 @@ class Reader1:
                     return result
                 # Perform attribute substitution on include macro file name.
                 fname = subs_attrs(mo.group('target'))
+                target = fname
                 if not fname:
+                    self.depend('include', mo.group('name'), mo.group('target'),
+                                target, None, False)
+                    return Reader1.read(self)   # Return next input line.
+                if self.fname == '<stdin>' and safe():
+                    # There is no source directory to confine includes to.
+                    message.unsafe('include file: %s' % fname)
+                    self.depend('include', mo.group('name'), mo.group('target'),
+                                target, None, False)
                     return Reader1.read(self)   # Return next input line.
                 if self.fname != '<stdin>':
                     fname = os.path.expandvars(os.path.expanduser(fname))
                     fname = safe_filename(fname, os.path.dirname(self.fname))
                     if not fname:
+                        self.depend('include', mo.group('name'),
+                                    mo.group('target'), target, None, False)
                         return Reader1.read(self)   # Return next input line.
                     if not os.path.isfile(fname):
                         if warnings:
                             message.warning('include file not found: %s' % fname)
+                        document.depend(fname, False)
+                        self.depend('include', mo.group('name'),
+                                    mo.group('target'), target, fname, False)
                         return Reader1.read(self)   # Return next input line.
+                    self.depend('include', mo.group('name'), mo.group('target'),
+                                target, fname, True)
                     if mo.group('name') == 'include1':
                         if not config.dumping:
                             if fname not in config.include1:
                                 message.verbose('include1: ' + fname, linenos=False)
                                 # Store the include file in memory for later
                                 # retrieval by the {include1:} system attribute.
-                                f = open(fname)
-                                try:
-                                    config.include1[fname] = [
-                                        s.rstrip() for s in f]
-                                finally:
-                                    f.close()
+                                config.include1[fname] = \
+                                        IncludeCache.readlines(fname)
                             return '{include1:%s}' % fname
                         else:
                             # This is a configuration dump, just pass the macro
@@ -4227,7 +4758,7 @@ class Reader1:
         return result
     def eof(self):
         """Returns True if all lines have been read."""
-        if len(self.next) == 0:
+        if not self.next and self.pos >= len(self.data):
             # End of current file.
             if self.parent:
                 self.closefile()
@@ -4243,14 +4774,15 @@ class Reader1:
         """Like read() but does not advance file pointer."""
         if Reader1.eof(self):
             return None
-        else:
-            return self.next[0][2]
+        if not self.next:
+            self.next.append(self.next_line())
+        return self.next[-1][2]
     def unread(self,cursor):
         """Push the line (filename,linenumber,linetext) tuple back into the read
         buffer. Note that it's up to the caller to restore the previous
         cursor."""
         assert cursor
-        self.next.insert(0,cursor)
+        self.next.append(cursor)
 
 class Reader(Reader1):
     """ Wraps (well, sought of) Reader1 class and implements conditional text
@@ -4308,6 +4840,8 @@ class Reader(Reader1):
                 if not target and name in ('ifdef','ifndef'):
                     raise EAsciiDoc,'missing macro target: %s' % result
                 defined = is_attr_defined(target, document.attributes)
+                if name != 'ifeval':
+                    self.depend('ifdef', target, defined)
                 if name == 'ifdef':
                     if attrlist:
                         if defined: return attrlist
@@ -4319,16 +4853,21 @@ class Reader(Reader1):
                     else:
                         self.skip = defined
                 elif name == 'ifeval':
-                    if safe():
+                    if safe() and not self.config:
                         message.unsafe('ifeval invalid')
                         raise EAsciiDoc,'ifeval invalid safe document'
                     if not attrlist:
                         raise EAsciiDoc,'missing ifeval condition: %s' % result
                     cond = False
                     attrlist = subs_attrs(attrlist)
+                    self.depend('ifeval', mo.group('attrlist'), attrlist)
                     if attrlist:
                         try:
-                            cond = eval(attrlist)
+                            if safe():
+                                # Attribute values are untrusted.
+                                cond = eval_literal(attrlist)
+                            else:
+                                cond = eval(attrlist)
                         except Exception,e:
                             raise EAsciiDoc,'error evaluating ifeval condition: %s: %s' % (result, str(e))
                         message.verbose('ifeval: %s: %r' % (attrlist, cond))
@@ -4345,8 +4884,10 @@ class Reader(Reader1):
             if mo:
                 action = mo.group('name')
                 cmd = mo.group('attrlist')
+                self.depend(action, cmd)
                 result = system(action, cmd, is_macro=True)
-                self.cursor[2] = result  # So we don't re-evaluate.
+                # So we don't re-evaluate if the line is pushed back.
+                self.cursor = self.cursor[:2] + (result,)
         if result:
             # Unescape escaped system macros.
             if macros.match('+',r'\\eval|\\sys|\\sys2|\\ifdef|\\ifndef|\\endif|\\include|\\include1',result):
@@ -4413,34 +4954,165 @@ class Reader(Reader1):
         return tuple(result)
 
 class Writer:
-    """Writes lines to output file."""
+    """
+    Writes lines to output file.
+
+    Doctests:
+
+    1. Check failed --atomic translations leave the output file untouched:
+
+       >>> d = tempfile.mkdtemp()
+       >>> infile,outfile = os.path.join(d,'doc.txt'),os.path.join(d,'doc.html')
+       >>> open(outfile,'w').write('previous output\\n')
+       >>> open(infile,'w').write('Text\\n\\nifeval::[1]\\nendif::[]\\n')
+       >>> opts = [('--no-header-footer',None),('--backend','html5'),
+       ...         ('--safe',None)]   # The ifeval macro is not allowed.
+       >>> execute_one(__file__, opts + [('--atomic',None)], infile)[1]
+       1
+       >>> open(outfile).read()    # Failed translation: output untouched.
+       'previous output\\n'
+       >>> sorted(os.listdir(d))
+       ['doc.html', 'doc.txt']
+       >>> execute_one(__file__, opts, infile)[1]
+       1
+       >>> os.listdir(d)        # Incomplete output file is deleted.
+       ['doc.txt']
+       >>> shutil.rmtree(d)
+
+    2. Check --if-changed does not rewrite unchanged output:
+
+       >>> d = tempfile.mkdtemp()
+       >>> infile,outfile = os.path.join(d,'doc.txt'),os.path.join(d,'doc.html')
+       >>> open(infile,'w').write('Text\\n')
+       >>> opts = [('--no-header-footer',None),('--backend','html5'),
+       ...         ('--if-changed',None)]
+       >>> execute_one(__file__, opts, infile)[1]
+       0
+       >>> os.utime(outfile, (1000000000,1000000000))
+       >>> execute_one(__file__, opts, infile)[1]
+       0
+       >>> os.stat(outfile).st_mtime   # Unchanged output is not rewritten.
+       1000000000.0
+       >>> open(infile,'w').write('New text\\n')
+       >>> execute_one(__file__, opts, infile)[1]
+       0
+       >>> os.stat(outfile).st_mtime > 1000000000
+       True
+       >>> open(outfile).read()
+       '<div class="paragraph"><p>New text</p></div>\\r\\n'
+       >>> shutil.rmtree(d)
+
+    """
+    WRITE_BUFFER_SIZE = 65536           # Output buffer flush threshold.
     def __init__(self):
         self.newline = '\r\n'            # End of line terminator.
         self.f = None                    # Output file object.
         self.fname = None                # Output file name.
         self.lines_out = 0               # Number of lines written.
         self.skip_blank_lines = False    # If True don't output blank lines.
+        self.stdout = None               # '<stdout>' file object (default
+                                         # sys.stdout).
+        self.atomic = False              # --atomic option.
+        self.if_changed = False          # --if-changed option.
+        self.buffer = []                 # Output not yet written to self.f.
+        self.buffer_size = 0             # Number of characters in buffer.
     def open(self,fname,bom=None):
         '''
         bom is optional byte order mark.
         http://en.wikipedia.org/wiki/Byte-order_mark
         '''
         self.fname = fname
+        self.buffer = []
+        self.buffer_size = 0
         if fname == '<stdout>':
-            self.f = sys.stdout
+            self.f = self.stdout or sys.stdout
+        elif self.atomic:
+            self.f = None   # Output is held in memory until close().
         else:
             self.f = open(fname,'wb+')
         message.verbose('writing: '+writer.fname,False)
         if bom:
-            self.f.write(bom)
+            self.buffer.append(bom)
         self.lines_out = 0
-    def close(self):
-        if self.fname != '<stdout>':
-            self.f.close()
+    def flush(self):
+        """Write buffered output to the output file."""
+        if self.buffer and self.f is not None:
+            self.f.write(''.join(self.buffer))
+            self.buffer = []
+            self.buffer_size = 0
+    def close(self,commit=True):
+        """Write buffered output and close the output file. If the --atomic
+        option was specified the output is written to a temporary file
+        which is then renamed to the output file so readers never see a
+        partially written file; if 'commit' is False it is discarded."""
+        if self.f is None:
+            try:
+                if commit:
+                    self.write_atomic()
+            finally:
+                self.buffer = []
+                self.buffer_size = 0
+        else:
+            self.flush()
+            if self.fname != '<stdout>':
+                self.f.close()
+    def unchanged(self,data):
+        """Return True if the output file exists and its content is the
+        same as 'data'."""
+        if not os.path.isfile(self.fname) or \
+                os.path.getsize(self.fname) != len(data):
+            return False
+        h = md5()
+        f = open(self.fname,'rb')
+        try:
+            while True:
+                s = f.read(self.WRITE_BUFFER_SIZE)
+                if not s:
+                    break
+                h.update(s)
+        finally:
+            f.close()
+        return h.digest() == md5(data).digest()
+    def write_atomic(self):
+        data = ''.join(self.buffer)
+        if self.if_changed and self.unchanged(data):
+            # Leave the output file (and its modification time) untouched.
+            message.verbose('unchanged: '+self.fname,False)
+            return
+        d = os.path.dirname(os.path.abspath(self.fname))
+        fd,tmp = tempfile.mkstemp(dir=d)
+        try:
+            f = os.fdopen(fd,'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            # Give the output file the same permissions it would have had
+            # if it had been written directly.
+            if os.path.isfile(self.fname):
+                mode = os.stat(self.fname).st_mode & 07777
+            else:
+                mask = os.umask(0)
+                os.umask(mask)
+                mode = 0666 & ~mask
+            os.chmod(tmp, mode)
+            if os.name == 'nt' and os.path.isfile(self.fname):
+                os.remove(self.fname)
+            os.rename(tmp, self.fname)
+        except:
+            if os.path.isfile(tmp):
+                os.unlink(tmp)
+            raise
+    def write_text(self,s,count=1):
+        """Buffer string 's' containing 'count' lines."""
+        self.buffer.append(s)
+        self.buffer_size = self.buffer_size + len(s)
+        self.lines_out = self.lines_out + count
+        if self.buffer_size >= self.WRITE_BUFFER_SIZE and self.f is not None:
+            self.flush()
     def write_line(self, line=None):
         if not (self.skip_blank_lines and (not line or not line.strip())):
-            self.f.write((line or '') + self.newline)
-            self.lines_out = self.lines_out + 1
+            self.write_text((line or '') + self.newline)
     def write(self,*args,**kwargs):
         """Iterates arguments, writes tuple and list arguments one line per
         element, else writes argument as single line. If no arguments writes
@@ -4454,8 +5126,14 @@ class Writer:
         else:
             for arg in args:
                 if is_array(arg):
-                    for s in arg:
-                        self.write_line(s)
+                    if self.skip_blank_lines:
+                        for s in arg:
+                            self.write_line(s)
+                    elif arg:
+                        # Write the lines as a single block.
+                        lines = [s or '' for s in arg]
+                        lines.append('')
+                        self.write_text(self.newline.join(lines), len(arg))
                 elif arg is not None:
                     self.write_line(arg)
     def write_tag(self,tag,content,subs=None,d=None,**kwargs):
@@ -4478,10 +5156,12 @@ class Writer:
 #---------------------------------------------------------------------------
 # Configuration file processing.
 #---------------------------------------------------------------------------
-def _subs_specialwords(mo):
+def _subs_specialwords(mo, word=None):
     """Special word substitution function called by
-    Config.subs_specialwords()."""
-    word = mo.re.pattern                    # The special word.
+    Config.subs_specialwords(). 'word' is the matched special word pattern
+    if 'mo' is a combined special words match."""
+    if word is None:
+        word = mo.re.pattern                # The special word.
     template = config.specialwords[word]    # The corresponding markup template.
     if not template in config.sections:
         raise EAsciiDoc,'missing special word template [%s]' % template
@@ -4502,6 +5182,496 @@ def _subs_specialwords(mo):
         result = writer.newline.join(lines)
     return result
 
+def write_cache_file(path, data):
+    """Write data to cache file path, creating the cache directory if
+    necessary. Failures are only reported in verbose mode."""
+    try:
+        d = os.path.dirname(path)
+        if not os.path.isdir(d):
+            os.makedirs(d)
+        # Write to a temporary file first so concurrent readers never see
+        # a partially written cache file.
+        fd,tmp = tempfile.mkstemp(dir=d)
+        f = os.fdopen(fd,'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        if os.name == 'nt' and os.path.isfile(path):
+            os.remove(path)
+        os.rename(tmp, path)
+    except Exception,e:
+        message.verbose('failed to write cache file: %s: %s' % (path,e),
+                False)
+
+class ConfigCache:
+    """
+    Caches the sections read from configuration files so that subsequent runs
+    don't have to re-read and re-process them. Static methods and attributes
+    only.
+
+    Cache entries are keyed by configuration file real path and load options.
+    Each entry records the file's modification time and size along with the
+    outcome of the system macros (ifdef, ifndef, ifeval, include1) evaluated
+    while the file was read.  An entry is reused only if the file is unchanged
+    and the recorded macros evaluate the same way against the current document
+    attributes.
+
+    Doctests:
+
+    1. Check unchanged configuration files are read from the cache:
+
+       >>> d = tempfile.mkdtemp()
+       >>> infile,conf = os.path.join(d,'doc.txt'),os.path.join(d,'my.conf')
+       >>> open(infile,'w').write('{greeting} world\\n')
+       >>> open(conf,'w').write('[attributes]\\ngreeting=Hello\\n')
+       >>> os.utime(conf, (1000000000,1000000000))
+       >>> opts = [('--cache-dir',os.path.join(d,'cache')),('--conf-file',conf),
+       ...         ('--no-header-footer',None),('--backend','html5')]
+       >>> def translate():
+       ...     execute_one(__file__, opts, infile)
+       ...     return open(os.path.join(d,'doc.html')).read()
+       >>> translate()
+       '<div class="paragraph"><p>Hello world</p></div>\\r\\n'
+       >>> len(os.listdir(os.path.join(d,'cache','conf'))) > 1
+       True
+       >>> ConfigCache.memory.clear()
+       >>> open(conf,'w').write('[attributes]\\ngreeting=Howdy\\n')
+       >>> os.utime(conf, (1000000000,1000000000))
+       >>> translate()     # Same size and time: the cached entry is used.
+       '<div class="paragraph"><p>Hello world</p></div>\\r\\n'
+       >>> open(conf,'w').write('[attributes]\\ngreeting=Goodbye\\n')
+       >>> translate()
+       '<div class="paragraph"><p>Goodbye world</p></div>\\r\\n'
+       >>> ConfigCache.is_cacheable([('ifdef','basebackend-html',True),
+       ...                           ('ifeval','"{x}"=="y"','"z"=="y"')])
+       True
+       >>> ConfigCache.is_cacheable([('sys','ls')])
+       False
+       >>> shutil.rmtree(d)
+
+    """
+    MAX_VARIANTS = 8    # Maximum number of entries per configuration file.
+    memory = {}         # Cache file contents keyed by cache file path.
+    in_memory = False   # If True cache in memory when there is no cache_dir.
+    def __init__(self):
+        raise AssertionError,'no class instances allowed'
+    @staticmethod
+    def enabled():
+        return bool(config.cache_dir) or ConfigCache.in_memory
+    @staticmethod
+    def path(fname, include, exclude):
+        """Return the cache file path for configuration file fname."""
+        key = '%s|%s|%s|%s|%s|%s' % (VERSION, os.path.realpath(fname),
+                ','.join(include), ','.join(exclude),
+                config.dumping, document.safe)
+        key = md5(key).hexdigest() + '.cache'
+        if config.cache_dir:
+            key = os.path.join(config.cache_dir, 'conf', key)
+        return key
+    @staticmethod
+    def entries(path):
+        """Return list of cache entries from cache file path."""
+        data = ConfigCache.memory.get(path)
+        if data is None:
+            if not config.cache_dir or not os.path.isfile(path):
+                return []
+            try:
+                f = open(path,'rb')
+                try:
+                    data = f.read()
+                finally:
+                    f.close()
+            except Exception:
+                return []
+            ConfigCache.memory[path] = data
+        try:
+            return pickle.loads(data)
+        except Exception:
+            message.verbose('ignoring malformed cache file: %s' % path, False)
+            return []
+    @staticmethod
+    def is_cacheable(depends):
+        """Return True if the system macros recorded in depends can be
+        revalidated."""
+        for d in depends:
+            if d[0] == 'include':
+                if d[-1] and d[1] != 'include1':
+                    return False    # Nested include files are not tracked.
+            elif d[0] not in ('ifdef','ifeval'):
+                return False        # Executable system macro.
+        return True
+    @staticmethod
+    def is_valid(depends):
+        """Return True if the system macros recorded in depends evaluate
+        the same with the current document attributes."""
+        for d in depends:
+            if d[0] == 'ifdef':
+                target,defined = d[1:]
+                if is_attr_defined(target, document.attributes) != defined:
+                    return False
+            elif d[0] == 'ifeval':
+                attrlist,value = d[1:]
+                if subs_attrs(attrlist) != value:
+                    return False
+            elif d[0] == 'include':
+                name,target,value,fname,found = d[1:]
+                if subs_attrs(target) != value:
+                    return False
+                if fname and os.path.isfile(fname) != found:
+                    return False
+            else:
+                return False
+        return True
+    @staticmethod
+    def get(fname, include=[], exclude=[]):
+        """
+        Return the sections dictionary for configuration file fname from the
+        cache. Return None if there is no valid cache entry.
+        """
+        path = ConfigCache.path(fname, include, exclude)
+        entries = ConfigCache.entries(path)
+        if not entries:
+            return None
+        st = os.stat(fname)
+        # Reader side effect (system macros may reference these attributes).
+        document.attributes['infile'] = fname
+        document.attributes['indir'] = os.path.dirname(fname)
+        for mtime,size,depends,sections in entries:
+            if mtime == st.st_mtime and size == st.st_size \
+                    and ConfigCache.is_valid(depends):
+                break
+        else:
+            return None
+        message.verbose('reading: %s (cached)' % fname, False)
+        # Load include1 files that the Reader would have loaded.
+        for d in depends:
+            if d[0] == 'include' and d[-1] and not config.dumping:
+                include1 = d[4]
+                if include1 not in config.include1:
+                    message.verbose('include1: ' + include1, linenos=False)
+                    config.include1[include1] = \
+                            IncludeCache.readlines(include1)
+        result = OrderedDict()
+        for k,v in sections:
+            result[k] = v
+        return result
+    @staticmethod
+    def put(fname, include, exclude, sections, depends):
+        """Add configuration file fname sections dictionary to the cache."""
+        if not ConfigCache.is_cacheable(depends):
+            message.verbose('not cached: %s' % fname, False)
+            return
+        path = ConfigCache.path(fname, include, exclude)
+        st = os.stat(fname)
+        entry = (st.st_mtime, st.st_size, depends, sections.items())
+        entries = [entry]
+        for e in ConfigCache.entries(path):
+            if e[:3] != entry[:3]:
+                entries.append(e)
+        data = pickle.dumps(entries[:ConfigCache.MAX_VARIANTS],
+                            pickle.HIGHEST_PROTOCOL)
+        ConfigCache.memory[path] = data
+        if config.cache_dir:
+            write_cache_file(path, data)
+
+class IncludeCache:
+    """
+    Caches the contents of files read by the include::[] and include1::[]
+    macros and the {include:} system attribute so that files included more
+    than once (in one or more documents) are only read once. Static methods
+    and attributes only.
+
+    Entries are keyed by file real path and are reused only if the file's
+    modification time and size are unchanged. The total size of the cached
+    files is limited to MAX_SIZE bytes, the least recently used entries are
+    discarded first.
+    """
+    MAX_SIZE = 16*1024*1024 # Maximum total size of cached file contents.
+    entries = {}    # [mtime,size,data,last_used] lists keyed by real path.
+    size = 0        # Total size of cached file contents.
+    clock = 0       # Incremented on each lookup (for last_used).
+    hits = 0
+    misses = 0
+    def __init__(self):
+        raise AssertionError,'no class instances allowed'
+    @staticmethod
+    def read(fname):
+        """Return the contents of file fname."""
+        document.depend(fname)
+        path = os.path.realpath(fname)
+        st = os.stat(path)
+        IncludeCache.clock += 1
+        entry = IncludeCache.entries.get(path)
+        if entry and entry[0] == st.st_mtime and entry[1] == st.st_size:
+            IncludeCache.hits += 1
+            entry[3] = IncludeCache.clock
+            return entry[2]
+        IncludeCache.misses += 1
+        f = open(path,'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        IncludeCache.discard(path)
+        if len(data) <= IncludeCache.MAX_SIZE:
+            IncludeCache.entries[path] = \
+                    [st.st_mtime, st.st_size, data, IncludeCache.clock]
+            IncludeCache.size += len(data)
+            while IncludeCache.size > IncludeCache.MAX_SIZE:
+                lru = min([(e[3],k) for k,e in IncludeCache.entries.items()])
+                IncludeCache.discard(lru[1])
+        return data
+    @staticmethod
+    def readlines(fname):
+        """Return list of right trimmed lines from file fname."""
+        lines = IncludeCache.read(fname).split('\n')
+        if not lines[-1]:
+            del lines[-1]   # Newline terminated last line (or empty file).
+        return [s.rstrip() for s in lines]
+    @staticmethod
+    def discard(path):
+        entry = IncludeCache.entries.pop(path, None)
+        if entry:
+            IncludeCache.size -= len(entry[2])
+
+class BuildCache:
+    """
+    Records the files that each output file was built from so that, with the
+    --incremental option, documents whose output file and dependencies are
+    unchanged are not translated again. Static methods and attributes only.
+
+    Records are keyed by source file and command-line options. Each record
+    contains the output file's modification time and size, the modification
+    time, size and MD5 digest of each dependency (see Document.depend()) and
+    the dependencies that were looked for but not found.
+
+    Doctests:
+
+    1. Check --incremental skips documents whose files are unchanged:
+
+       >>> d = tempfile.mkdtemp()
+       >>> infile,part = os.path.join(d,'doc.txt'),os.path.join(d,'part.txt')
+       >>> outfile = os.path.join(d,'doc.html')
+       >>> open(infile,'w').write('include::part.txt[]\\n\\ninclude::new.txt[]\\n')
+       >>> open(part,'w').write('One\\n')
+       >>> opts = [('--cache-dir',os.path.join(d,'cache')),('--incremental',None),
+       ...         ('--no-header-footer',None),('--backend','html5')]
+       >>> def translate():
+       ...     mtime = os.stat(outfile).st_mtime
+       ...     time.sleep(0.01)
+       ...     status = execute_one(__file__, opts, infile)[1]
+       ...     written = os.stat(outfile).st_mtime != mtime
+       ...     return status, written, open(outfile).read()
+       >>> open(outfile,'w').write('')
+       >>> translate()
+       (0, True, '<div class="paragraph"><p>One</p></div>\\r\\n')
+       >>> translate()     # Unchanged: the output file is not written.
+       (0, False, '<div class="paragraph"><p>One</p></div>\\r\\n')
+       >>> os.utime(part, (1000000000,1000000000))
+       >>> translate()     # Modification time changes alone don't count.
+       (0, False, '<div class="paragraph"><p>One</p></div>\\r\\n')
+       >>> open(part,'w').write('Two\\n')
+       >>> translate()     # Changed include file.
+       (0, True, '<div class="paragraph"><p>Two</p></div>\\r\\n')
+       >>> open(os.path.join(d,'new.txt'),'w').write('New\\n')
+       >>> status,written,output = translate()  # Previously missing file.
+       >>> status, written, 'New' in output
+       (0, True, True)
+       >>> translate()[1]
+       False
+       >>> shutil.rmtree(d)
+
+    """
+    def __init__(self):
+        raise AssertionError,'no class instances allowed'
+    @staticmethod
+    def path(infile, opts):
+        """Return the build record file path for source file infile."""
+        opts = [(o,v) for o,v in opts if o not in ('-v','--verbose')]
+        key = '%s|%s|%s|%r' % (VERSION, os.getcwd(), infile, opts)
+        return os.path.join(config.cache_dir, 'build',
+                md5(key).hexdigest() + '.cache')
+    @staticmethod
+    def digest(fname):
+        f = open(fname,'rb')
+        try:
+            return md5(f.read()).hexdigest()
+        finally:
+            f.close()
+    @staticmethod
+    def get(path):
+        """
+        Return the (outfile, dependencies, missing) tuple from build record
+        file path if the output file and its dependencies are unchanged else
+        return None.
+        """
+        if not os.path.isfile(path):
+            return None
+        try:
+            f = open(path,'rb')
+            try:
+                outfile,stat,deps,missing = pickle.load(f)
+            finally:
+                f.close()
+        except Exception:
+            message.verbose('ignoring malformed cache file: %s' % path, False)
+            return None
+        if not os.path.isfile(outfile):
+            return None
+        st = os.stat(outfile)
+        if (st.st_mtime, st.st_size) != stat:
+            return None     # Output file modified by someone else.
+        for fname,mtime,size,digest in deps:
+            if not os.path.isfile(fname):
+                return None
+            st = os.stat(fname)
+            if (st.st_mtime, st.st_size) != (mtime, size):
+                # Modification time changes alone don't count.
+                if st.st_size != size or BuildCache.digest(fname) != digest:
+                    return None
+        for fname in missing:
+            if os.path.exists(fname):
+                return None
+        return (outfile, [d[0] for d in deps], missing)
+    @staticmethod
+    def put(path, outfile, deps, missing):
+        """Write the build record for outfile to file path."""
+        records = []
+        try:
+            for fname in deps:
+                st = os.stat(fname)
+                records.append((fname, st.st_mtime, st.st_size,
+                                BuildCache.digest(fname)))
+            st = os.stat(outfile)
+        except EnvironmentError:
+            return
+        data = pickle.dumps((outfile, (st.st_mtime,st.st_size), records,
+                             missing), pickle.HIGHEST_PROTOCOL)
+        write_cache_file(path, data)
+
+class FilterCache:
+    """
+    Caches filter output in the --cache-dir directory so that unchanged
+    filtered blocks are not filtered again. Static methods and attributes
+    only.
+
+    Entries are keyed by the filter command (after attribute substitution),
+    the modification time and size of the filter script or program and the
+    filter input. Filters that write output files (the -o FILE option of the
+    image generating filters) are not cached: the files they wrote may have
+    been overwritten since.
+
+    Doctests:
+
+    1. Check filter output is cached unless the filter writes output files:
+
+       >>> FilterCache.cacheable('upper.py -')
+       True
+       >>> FilterCache.cacheable('image.py -o "a.png" -')
+       False
+       >>> d = tempfile.mkdtemp()
+       >>> os.mkdir(os.path.join(d,'filters'))
+       >>> open(os.path.join(d,'filters','upper.py'),'w').write(
+       ...     'import sys\\nsys.stdout.write(sys.stdin.read().upper())\\n')
+       >>> open(os.path.join(d,'filters','image.py'),'w').write(
+       ...     'import sys\\nopen(sys.argv[2],"w").write(sys.stdin.read())\\n')
+       >>> conf = os.path.join(d,'filters.conf')
+       >>> open(conf,'w').write('[blockdef-listing]\\n'
+       ...     'upper-style=template="listingblock",filter="upper.py"\\n'
+       ...     'image-style=template="listingblock",posattrs=("style","target"),'
+       ...     'filter="image.py -o {target}"\\n')
+       >>> infile,image = os.path.join(d,'doc.txt'),os.path.join(d,'img.txt')
+       >>> cache = os.path.join(d,'cache')
+       >>> opts = [('--cache-dir',cache),('--conf-file',conf),
+       ...         ('--no-header-footer',None),('--backend','html5')]
+       >>> def translate(text):
+       ...     open(infile,'w').write(text)
+       ...     execute_one(__file__, opts, infile)
+       ...     return open(os.path.join(d,'doc.html')).read()
+       >>> doc = '[image,%s]\\n----\\n%s\\n----\\n'
+       >>> for v in ('v1','v2','v1'):
+       ...     html = translate(doc % (image,v))
+       ...     print v, open(image).read().strip()
+       v1 v1
+       v2 v2
+       v1 v1
+       >>> os.path.isdir(os.path.join(cache,'filters'))
+       False
+       >>> html = translate('[upper]\\n----\\nHello\\n----\\n')
+       >>> 'HELLO' in html
+       True
+       >>> html == translate('[upper]\\n----\\nHello\\n----\\n')
+       True
+       >>> len(os.listdir(os.path.join(cache,'filters')))
+       1
+       >>> shutil.rmtree(d)
+
+    """
+    programs = {}   # Filter program paths keyed by command.
+    def __init__(self):
+        raise AssertionError,'no class instances allowed'
+    @staticmethod
+    def enabled():
+        return bool(config.cache_dir)
+    @staticmethod
+    def cacheable(filter_cmd):
+        """Return False if filter_cmd may write output files."""
+        return not re.search(r'(^|\s)(-o|--output\b)', filter_cmd)
+    @staticmethod
+    def program(cmd):
+        """Return the (path,mtime,size) of filter program cmd or None if it
+        is not found."""
+        if cmd not in FilterCache.programs:
+            if os.path.dirname(cmd):
+                paths = [cmd]
+            else:
+                paths = [os.path.join(d,cmd)
+                        for d in os.environ.get('PATH','').split(os.pathsep)]
+            FilterCache.programs[cmd] = None
+            for path in paths:
+                if os.path.isfile(path):
+                    FilterCache.programs[cmd] = path
+                    break
+        path = FilterCache.programs[cmd]
+        if path is None or not os.path.isfile(path):
+            return None
+        st = os.stat(path)
+        return (path, st.st_mtime, st.st_size)
+    @staticmethod
+    def path(filter_cmd, cmd, lines):
+        """Return the cache file path for filter_cmd output of lines."""
+        key = md5('%s|%s|%s|%r' % (VERSION, os.getcwd(), filter_cmd,
+                FilterCache.program(cmd)))
+        for line in lines:
+            key.update(line + '\n')
+        return os.path.join(config.cache_dir, 'filters',
+                key.hexdigest() + '.cache')
+    @staticmethod
+    def get(path):
+        """Return the cached filter output lines or None."""
+        if not os.path.isfile(path):
+            return None
+        try:
+            f = open(path,'rb')
+            try:
+                result = pickle.load(f)
+            finally:
+                f.close()
+            if not isinstance(result, list):
+                raise ValueError
+        except Exception:
+            message.verbose('ignoring malformed cache file: %s' % path, False)
+            return None
+        return result
+    @staticmethod
+    def put(path, result):
+        """Add filter output lines result to the cache."""
+        write_cache_file(path, pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+
+# Splits a markup template line at the | tag placeholder.
+TEMPLATE_SPLIT_RE = re.compile(r'(?P<stag>.*)\|(?P<etag>.*)')
+
 class Config:
     """Methods to process configuration files."""
     # Non-template section name regexp's.
@@ -4527,12 +5697,19 @@ class Config:
         self.subsverbatim = SUBS_VERBATIM
 
         self.tags = {}          # Values contain (stag,etag) tuples.
+        self.templates = {}     # Compiled section2tags() (stag,etag) tuples.
+        self.quotes_compiled = None # Compiled subs_quotes() patterns.
         self.specialchars = {}  # Values of special character substitutions.
+        self.specialchars_table = ()    # Ordered (char,value) replacements.
+        self.specialchars_re = None     # Matches any special character.
         self.specialwords = {}  # Name is special word pattern, value is macro.
+        self.specialwords_compiled = None   # Cached compile_specialwords().
+        self.specialwords_chunks = {}   # Combined special words regexps.
         self.replacements = OrderedDict()   # Key is find pattern, value is
                                             #replace pattern.
         self.replacements2 = OrderedDict()
         self.replacements3 = OrderedDict()
+        self.replacements_compiled = {} # Keyed by replacements section name.
         self.specialsections = {} # Name is special section name pattern, value
                                   # is corresponding section name.
         self.quotes = OrderedDict()    # Values contain corresponding tag name.
@@ -4543,6 +5720,7 @@ class Config:
         self.include1 = {}      # Holds include1::[] files for {include1:}.
         self.dumping = False    # True if asciidoc -c option specified.
         self.filters = []       # Filter names specified by --filter option.
+        self.cache_dir = None   # Cache directory (--cache-dir option).
 
     def init(self, cmd):
         """
@@ -4599,41 +5777,53 @@ class Config:
             fname = os.path.join(dir, fname)
         # Sliently skip missing configuration file.
         if not os.path.isfile(fname):
+            document.depend(fname, False)
             return False
         # Don't load conf files twice (local and application conf files are the
         # same if the source file is in the application directory).
         if os.path.realpath(fname) in self.loaded:
             return True
-        rdr = Reader()  # Reader processes system macros.
-        message.linenos = False         # Disable document line numbers.
-        rdr.open(fname)
-        message.linenos = None
+        document.depend(fname)
         self.fname = fname
-        reo = re.compile(r'(?u)^\[(?P<section>\+?[^\W\d][\w-]*)\]\s*$')
-        sections = OrderedDict()
-        section,contents = '',[]
-        while not rdr.eof():
-            s = rdr.read()
-            if s and s[0] == '#':       # Skip comment lines.
-                continue
-            if s[:2] == '\\#':          # Unescape lines starting with '#'.
-                s = s[1:]
-            s = s.rstrip()
-            found = reo.findall(s)
-            if found:
-                update_section(section) # Store previous section.
-                section = found[0].lower()
-                contents = []
-            else:
-                contents.append(s)
-        update_section(section)         # Store last section.
-        rdr.close()
-        if include:
-            for s in set(sections) - set(include):
-                del sections[s]
-        if exclude:
-            for s in set(sections) & set(exclude):
-                del sections[s]
+        sections = None
+        if ConfigCache.enabled():
+            sections = ConfigCache.get(fname, include, exclude)
+        if sections is None:
+            rdr = Reader()  # Reader processes system macros.
+            rdr.config = True
+            if ConfigCache.enabled():
+                rdr.depends = []
+            message.linenos = False         # Disable document line numbers.
+            rdr.open(fname)
+            message.linenos = None
+            reo = re.compile(r'(?u)^\[(?P<section>\+?[^\W\d][\w-]*)\]\s*$')
+            sections = OrderedDict()
+            section,contents = '',[]
+            while not rdr.eof():
+                s = rdr.read()
+                if s and s[0] == '#':       # Skip comment lines.
+                    continue
+                if s[:2] == '\\#':          # Unescape lines starting with '#'.
+                    s = s[1:]
+                s = s.rstrip()
+                found = reo.findall(s)
+                if found:
+                    update_section(section) # Store previous section.
+                    section = found[0].lower()
+                    contents = []
+                else:
+                    contents.append(s)
+            update_section(section)         # Store last section.
+            depends = rdr.depends
+            rdr.close()
+            if include:
+                for s in set(sections) - set(include):
+                    del sections[s]
+            if exclude:
+                for s in set(sections) & set(exclude):
+                    del sections[s]
+            if ConfigCache.enabled():
+                ConfigCache.put(fname, include, exclude, sections, depends)
         attrs = {}
         self.load_sections(sections,attrs)
         if not include:
@@ -4667,6 +5857,8 @@ class Config:
             else:
                 # Replace section.
                 self.sections[k] = v
+        self.templates = {}
+        self.quotes_compiled = None
         self.parse_tags()
         # Internally [miscellaneous] section entries are just attributes.
         d = {}
@@ -4681,6 +5873,7 @@ class Config:
         parse_entries(sections.get('titles',()),d)
         Title.load(d)
         parse_entries(sections.get('specialcharacters',()),self.specialchars,escape_delimiter=False)
+        self.parse_specialchars()
         parse_entries(sections.get('quotes',()),self.quotes)
         self.parse_specialwords()
         self.parse_replacements()
@@ -4872,6 +6065,7 @@ class Config:
                     tag = tag[1:]
                 if not tag in self.tags:
                     message.warning('[quotes] %s missing tag definition: %s' % (q,tag))
+        self.quotes_compiled = None
         # Check all specialsections section names exist.
         for k,v in self.specialsections.items():
             if not v:
@@ -5016,6 +6210,16 @@ class Config:
             if not self.set_replacement(pat, rep, getattr(self,sect)):
                 raise EAsciiDoc,'[%s] entry in %s is not a valid' \
                     ' regular expression: %s' % (sect,self.fname,pat)
+        self.compile_replacements(sect)
+
+    def compile_replacements(self,sect='replacements'):
+        """Compile replacements dictionary 'sect' into an ordered list of
+        (literal,reo,rep) tuples in self.replacements_compiled[sect], where
+        'literal' is a string that any 'reo' match must contain."""
+        result = []
+        for pat,rep in getattr(self,sect).items():
+            result.append((re_literal(pat),re.compile(pat),rep))
+        self.replacements_compiled[sect] = result
 
     @staticmethod
     def set_replacement(pat, rep, replacements):
@@ -5030,13 +6234,83 @@ class Config:
             replacements[pat] = strip_quotes(rep)
         return True
 
+    def compile_quotes(self):
+        """Return list of (lq,reo,tag) tuples for subs_quotes() where lq is
+        the left quote, reo the compiled quote regular expression and tag
+        the quote tag name. The list is built once and cached until the
+        [quotes] section is next modified."""
+        if self.quotes_compiled is not None:
+            return self.quotes_compiled
+        result = []
+        for q in self.quotes.keys():
+            i = q.find('|')
+            if i != -1 and q != '|' and q != '||':
+                lq = q[:i]      # Left quote.
+                rq = q[i+1:]    # Right quote.
+            else:
+                lq = rq = q
+            tag = self.quotes[q]
+            if not tag: continue
+            # Unconstrained quotes prefix the tag name with a hash.
+            if tag[0] == '#':
+                tag = tag[1:]
+                # Unconstrained quotes can appear anywhere.
+                reo = re.compile(r'(?msu)(^|.)(\[(?P<attrlist>[^[\]]+?)\])?' \
+                        + r'(?:' + re.escape(lq) + r')' \
+                        + r'(?P<content>.+?)(?:'+re.escape(rq)+r')')
+            else:
+                # The text within constrained quotes must be bounded by white
+                # space. Non-word (\W) characters are allowed at boundaries to
+                # accomodate enveloping quotes and punctuation e.g. a='x',
+                # ('x'), 'x', ['x'].
+                reo = re.compile(r'(?msu)(^|[^\w;:}])(\[(?P<attrlist>[^[\]]+?)\])?' \
+                    + r'(?:' + re.escape(lq) + r')' \
+                    + r'(?P<content>\S|\S.*?\S)(?:'+re.escape(rq)+r')(?=\W|$)')
+            result.append((lq,reo,tag))
+        self.quotes_compiled = result
+        return result
+
     def subs_replacements(self,s,sect='replacements'):
         """Substitute patterns from self.replacements in 's'."""
         result = s
-        for pat,rep in getattr(self,sect).items():
-            result = re.sub(pat, rep, result)
+        for literal,reo,rep in self.replacements_compiled.get(sect,()):
+            if literal not in result:
+                continue    # Pattern can't match.
+            result = reo.sub(rep, result)
         return result
 
+    def parse_specialchars(self):
+        """Compile self.specialchars into the self.specialchars_re regular
+        expression and the self.specialchars_table list of (char,value)
+        replacements. The table is ordered so that no replacement is
+        applied to the value of an earlier one; if there is no such order
+        the table is set to None and substitution falls back to
+        self.specialchars_re."""
+        chars = [k for k in self.specialchars.keys() if len(k) == 1]
+        if not chars:
+            self.specialchars_re = None
+            self.specialchars_table = ()
+            return
+        chars.sort()
+        self.specialchars_re = re.compile(
+                '[' + ''.join([re.escape(ch) for ch in chars]) + ']')
+        table = []
+        while chars:
+            for ch in chars:
+                # Characters that appear in this value must be done first.
+                value = self.specialchars[ch]
+                for other in chars:
+                    if other != ch and other in value:
+                        break
+                else:
+                    table.append((ch,value))
+                    chars.remove(ch)
+                    break
+            else:
+                table = None
+                break
+        self.specialchars_table = table
+
     def parse_specialwords(self):
         """Parse special words section into self.specialwords dictionary."""
         reo = re.compile(r'(?:\s|^)(".+?"|[^"\s]+)(?=\s|$)')
@@ -5063,6 +6337,7 @@ class Config:
                             'is not a valid regular expression: %s' \
                             % (self.fname,word)
                     self.specialwords[word] = name
+        self.specialwords_compiled = None
 
     def subs_specialchars(self,s):
         """Perform special character substitution on string 's'."""
@@ -5070,10 +6345,14 @@ class Config:
         character, the reason we don't is because the escape character itself
         then has to be escaped and this makes including code listings
         problematic. Use the predefined {amp},{lt},{gt} attributes instead."""
-        result = ''
-        for ch in s:
-            result = result + self.specialchars.get(ch,ch)
-        return result
+        reo = self.specialchars_re
+        if reo is None or not reo.search(s):
+            return s
+        if self.specialchars_table is None:
+            return reo.sub(lambda mo: self.specialchars[mo.group()], s)
+        for ch,value in self.specialchars_table:
+            s = s.replace(ch, value)
+        return s
 
     def subs_specialchars_reverse(self,s):
         """Perform reverse special character substitution on string 's'."""
@@ -5085,11 +6364,81 @@ class Config:
     def subs_specialwords(self,s):
         """Search for word patterns from self.specialwords in 's' and
         substitute using corresponding macro."""
+        compiled = self.compile_specialwords()
+        active = []
+        for i in range(len(compiled)):
+            if compiled[i][0] in s:
+                active.append(i)
+        if not active:
+            return s
+        active = tuple(active)
+        chunks = self.specialwords_chunks.get(active)
+        if chunks is None:
+            if len(self.specialwords_chunks) >= 1000:
+                self.specialwords_chunks = {}
+            chunks = self.chunk_specialwords([compiled[i] for i in active])
+            self.specialwords_chunks[active] = chunks
         result = s
-        for word in self.specialwords.keys():
-            result = re.sub(word, _subs_specialwords, result)
+        for reo,branches in chunks:
+            if branches is None:
+                result = reo.sub(_subs_specialwords, result)
+            else:
+                result = reo.sub(lambda mo:
+                        _subs_specialwords(mo, branches[mo.lastindex]),
+                        result)
         return result
 
+    def compile_specialwords(self):
+        """Return list of (literal,word,reo) tuples for subs_specialwords(),
+        'literal' is a string that any 'word' match must contain and 'reo'
+        is the compiled 'word'. The list is cached until [specialwords] is
+        next parsed."""
+        if self.specialwords_compiled is None:
+            result = []
+            for word in self.specialwords.keys():
+                result.append((re_literal(word),word,re.compile(word)))
+            self.specialwords_compiled = result
+            self.specialwords_chunks = {}
+        return self.specialwords_compiled
+
+    def chunk_specialwords(self, compiled):
+        """Combine compile_specialwords() list items into a list of
+        (reo,branches) tuples: 'reo' matches a set of special words in a
+        single scan, each word wrapped in a numbered group, and 'branches'
+        maps the group number back to the word. Words that can't be
+        combined (they contain back references, conditional groups, inline
+        flags or clashing group names) are returned as their own 'reo' with
+        'branches' set to None. The re module limits the number of groups
+        so large word lists are split into more than one chunk."""
+        result = []
+        separate = []
+        alternatives = []
+        branches = {}
+        groupnames = {}
+        index = 1
+        for literal,word,reo in compiled:
+            if RE_UNCOMBINABLE.search(word):
+                separate.append((reo,None))
+                continue
+            if index + reo.groups >= RE_MAX_GROUPS:
+                result.append((re.compile('|'.join(alternatives)),branches))
+                alternatives = []
+                branches = {}
+                groupnames = {}
+                index = 1
+            for name in reo.groupindex.keys():
+                if name in groupnames:
+                    separate.append((reo,None))
+                    break
+            else:
+                groupnames.update(reo.groupindex)
+                alternatives.append('(' + word + ')')
+                branches[index] = word
+                index += 1 + reo.groups
+        if alternatives:
+            result.append((re.compile('|'.join(alternatives)),branches))
+        return result + separate
+
     def expand_templates(self,entries):
         """Expand any template::[] macros in a list of section entries."""
         result = []
@@ -5109,13 +6458,16 @@ class Config:
     def expand_all_templates(self):
         for k,v in self.sections.items():
             self.sections[k] = self.expand_templates(v)
-
-    def section2tags(self, section, d={}, skipstart=False, skipend=False):
-        """Perform attribute substitution on 'section' using document
-        attributes plus 'd' attributes. Return tuple (stag,etag) containing
-        pre and post | placeholder tags. 'skipstart' and 'skipend' are
-        used to suppress substitution."""
-        assert section is not None
+        self.templates = {}
+
+    def compile_template(self, section):
+        """Split template 'section' body into start and end tag tuples
+        at the first | placeholder. The result is cached in
+        self.templates until the sections are next modified and the
+        template lines are pre-tokenized for subs_attrs()."""
+        result = self.templates.get(section)
+        if result is not None:
+            return result
         if section in self.sections:
             body = self.sections[section]
         else:
@@ -5127,7 +6479,7 @@ class Config:
         in_stag = True
         for s in body:
             if in_stag:
-                mo = re.match(r'(?P<stag>.*)\|(?P<etag>.*)',s)
+                mo = TEMPLATE_SPLIT_RE.match(s)
                 if mo:
                     if mo.group('stag'):
                         stag.append(mo.group('stag'))
@@ -5138,6 +6490,21 @@ class Config:
                     stag.append(s)
             else:
                 etag.append(s)
+        for s in stag + etag:
+            if '{' in s:
+                subs_attrs_tokenize(s)
+        result = (tuple(stag), tuple(etag))
+        if section in self.sections:
+            self.templates[section] = result
+        return result
+
+    def section2tags(self, section, d={}, skipstart=False, skipend=False):
+        """Perform attribute substitution on 'section' using document
+        attributes plus 'd' attributes. Return tuple (stag,etag) containing
+        pre and post | placeholder tags. 'skipstart' and 'skipend' are
+        used to suppress substitution."""
+        assert section is not None
+        stag,etag = self.compile_template(section)
         # Do attribute substitution last so {brkbar} can be used to escape |.
         # But don't do attribute substitution on title -- we've already done it.
         title = d.get('title')
@@ -5888,6 +7255,53 @@ trace = Trace()             # Implements trace attribute processing.
 # List of message strings written to stderr.
 messages = message.messages
 
+def reset_asciidoc():
+    """
+    Reinitialize the global processing state (the global instances and the
+    static attributes of the static classes) so the next document can be
+    processed in the same process. The ConfigCache is not reset.
+    """
+    global document, config, reader, writer, message, paragraphs, lists, \
+        blocks, tables_OLD, tables, macros, calloutmap, trace, messages
+    document = Document()
+    config = Config()
+    reader = Reader()
+    writer = Writer()
+    message = Message()
+    paragraphs = Paragraphs()
+    lists = Lists()
+    blocks = DelimitedBlocks()
+    tables_OLD = Tables_OLD()
+    tables = Tables()
+    macros = Macros()
+    calloutmap = CalloutMap()
+    trace = Trace()
+    messages = message.messages
+    Lex.prev_element = None
+    Lex.prev_cursor = None
+    AttributeEntry.pattern = None
+    AttributeEntry.subs = None
+    AttributeEntry.name = None
+    AttributeEntry.name2 = None
+    AttributeEntry.value = None
+    AttributeEntry.attributes = {}
+    AttributeList.pattern = None
+    AttributeList.match = None
+    AttributeList.attrs = {}
+    BlockTitle.title = None
+    BlockTitle.pattern = None
+    Title.subs = ()
+    Title.pattern = None
+    Title.level = 0
+    Title.attributes = {}
+    Title.sectname = None
+    Title.section_numbers = [0]*len(Title.underlines)
+    Title.dump_dict = {}
+    Title.linecount = None
+    Section.endtags = []
+    Section.ids = []
+    AbstractBlock.blocknames = []
+
 
 def asciidoc(backend, doctype, confiles, infile, outfile, options):
     """Convert AsciiDoc document to DocBook document of type doctype
@@ -5967,9 +7381,12 @@ def asciidoc(backend, doctype, confiles, infile, outfile, options):
                 config.load_filters([indir])
                 # Load document specific configuration files.
                 f = os.path.splitext(infile)[0]
-                doc_conffiles = [
-                        f for f in (f+'.conf', f+'-'+document.backend+'.conf')
-                        if os.path.isfile(f) ]
+                doc_conffiles = []
+                for f in (f+'.conf', f+'-'+document.backend+'.conf'):
+                    if os.path.isfile(f):
+                        doc_conffiles.append(f)
+                    else:
+                        document.depend(f, False)
                 for f in doc_conffiles:
                     config.load_file(f)
         load_conffiles()
@@ -6019,32 +7436,42 @@ def asciidoc(backend, doctype, confiles, infile, outfile, options):
             writer.newline = config.newline
             try:
                 writer.open(outfile, reader.bom)
+                translated = False
                 try:
                     document.translate(has_header) # Generate the output.
+                    translated = True
                 finally:
-                    writer.close()
+                    writer.close(translated)
             finally:
                 reader.closefile()
+                if IncludeCache.hits or IncludeCache.misses:
+                    message.verbose('include cache: %d hits, %d misses' %
+                            (IncludeCache.hits, IncludeCache.misses), False)
     except KeyboardInterrupt:
         raise
     except Exception,e:
-        # Cleanup.
-        if outfile and outfile != '<stdout>' and os.path.isfile(outfile):
+        # Cleanup (atomic output leaves any previous output file intact).
+        if outfile and outfile != '<stdout>' and not writer.atomic \
+                and os.path.isfile(outfile):
             os.unlink(outfile)
+        document.deps = None    # The output file was not written.
         # Build and print error description.
         msg = 'FAILED: '
         if reader.cursor:
             msg = message.format('', msg)
         if isinstance(e, EAsciiDoc):
-            message.stderr('%s%s' % (msg,str(e)))
+            message.stderr('%s%s' % (msg,str(e)),
+                    message.record('FAILED',str(e)))
         else:
+            record = message.record('FAILED','unexpected error: %s' % str(e))
             if __name__ == '__main__':
-                message.stderr(msg+'unexpected error:')
+                message.stderr(msg+'unexpected error:',record)
                 message.stderr('-'*60)
                 traceback.print_exc(file=sys.stderr)
                 message.stderr('-'*60)
             else:
-                message.stderr('%sunexpected error: %s' % (msg,str(e)))
+                message.stderr('%sunexpected error: %s' % (msg,str(e)),
+                        record)
         sys.exit(1)
 
 def usage(msg=''):
@@ -6124,6 +7551,8 @@ def execute(cmd,opts,args):
     outfile = None
     options = []
     help_option = False
+    deps_file = None
+    incremental = False
     for o,v in opts:
         if o in ('--help','-h'):
             help_option = True
@@ -6137,6 +7566,19 @@ def execute(cmd,opts,args):
             sys.exit(0)
         if o in ('-b','--backend'):
             backend = v
+        if o == '--atomic':
+            writer.atomic = True
+        if o == '--if-changed':
+            writer.atomic = True
+            writer.if_changed = True
+        if o == '--cache-dir':
+            config.cache_dir = os.path.abspath(v)
+        if o == '--deps':
+            deps_file = v
+            if document.deps is None:
+                document.deps = []
+        if o == '--incremental':
+            incremental = True
         if o in ('-c','--dump-conf'):
             options.append('-c')
         if o in ('-d','--doctype'):
@@ -6182,7 +7624,8 @@ def execute(cmd,opts,args):
     if len(args) == 0:
         usage('No source file specified')
         sys.exit(1)
-    stdin,stdout = sys.stdin,sys.stdout
+    stdin,stdout = reader.stdin,writer.stdout
+    sys_stdout = sys.stdout
     try:
         infile = args[0]
         if infile == '-':
@@ -6190,7 +7633,7 @@ def execute(cmd,opts,args):
         elif isinstance(infile, str):
             infile = os.path.abspath(infile)
         else:   # Input file is file object from API call.
-            sys.stdin = infile
+            reader.stdin = infile
             infile = '<stdin>'
         if outfile == '-':
             outfile = '<stdout>'
@@ -6200,14 +7643,586 @@ def execute(cmd,opts,args):
             if infile == '<stdin>':
                 outfile = '<stdout>'
         else:   # Output file is file object from API call.
-            sys.stdout = outfile
+            writer.stdout = outfile
+            if '-c' in options:
+                # Configuration dumps are written to sys.stdout.
+                sys.stdout = outfile
             outfile = '<stdout>'
+        if deps_file and outfile == '<stdout>':
+            usage('--deps option requires an output file')
+            sys.exit(1)
+        build = None
+        if incremental and '-c' not in options:
+            if infile == '<stdin>' or outfile == '<stdout>':
+                usage('--incremental option requires input and output files')
+                sys.exit(1)
+            if not config.cache_dir:
+                usage('--incremental option requires --cache-dir option')
+                sys.exit(1)
+            build = BuildCache.path(infile, opts)
+            record = BuildCache.get(build)
+            if record:
+                document.outfile = record[0]
+                if document.deps is not None:
+                    document.deps = record[1]
+                    document.missing = record[2]
+                if '-v' in options:
+                    config.verbose = True
+                message.verbose('skipping: %s (unchanged)' % infile, False)
+                if deps_file:
+                    write_deps(deps_file, [record[:2]])
+                return
+            if document.deps is None:
+                document.deps = []
+        if document.deps is not None and infile != '<stdin>':
+            document.depend(infile)
         # Do the work.
         asciidoc(backend, doctype, confiles, infile, outfile, options)
+        if deps_file and document.deps is not None and not config.dumping:
+            write_deps(deps_file, [(document.outfile, document.deps)])
+        if build and document.deps is not None and not document.has_errors:
+            BuildCache.put(build, document.outfile, document.deps,
+                           document.missing)
         if document.has_errors:
             sys.exit(1)
     finally:
-        sys.stdin,sys.stdout = stdin,stdout
+        reader.stdin,writer.stdout = stdin,stdout
+        sys.stdout = sys_stdout
+
+def execute_one(cmd,opts,infile,deps=None):
+    """
+    Reset the global processing state then execute asciidoc for source file
+    infile. Returns the (infile, status) tuple where status is the exit
+    status that execute() would return. If deps is a list the document's
+    (outfile, dependencies) tuple is appended to it (see write_deps()).
+    """
+    reset_asciidoc()
+    if deps is not None:
+        document.deps = []
+    try:
+        execute(cmd,opts,[infile])
+        status = 0
+    except SystemExit,e:
+        status = e.code
+        if status is None:
+            status = 0
+    if deps is not None and document.deps is not None \
+            and document.outfile and not config.dumping:
+        deps.append((document.outfile, document.deps))
+    return (infile,status)
+
+def _init_worker():
+    """Batch mode worker process initializer."""
+    ConfigCache.in_memory = True
+
+def _execute_job(job):
+    """Batch mode worker process job (a (cmd, opts, infile, deps) tuple).
+    Returns an (infile, status, deps) tuple."""
+    cmd,opts,infile,deps = job
+    try:
+        return execute_one(cmd,opts,infile,deps) + (deps,)
+    except KeyboardInterrupt:
+        return (infile,1,deps)
+
+def execute_many(cmd,opts,args,jobs=1):
+    """
+    Execute asciidoc with command-line options and arguments once for each
+    source file name in args. The global processing state is reset before
+    each document and processed configuration files are cached in memory
+    so they are only read once. Each document is written to its default
+    output file (the -o, --out-file option is not allowed).
+
+    If jobs is greater than 1 the documents are processed by a pool of jobs
+    worker processes (each worker keeps its own configuration cache). The
+    documents are processed sequentially if the multiprocessing module is
+    not available.
+
+    Returns a list of (infile, status) tuples where status is the exit
+    status that execute() would return for the document.
+
+    Doctests:
+
+    1. Check batch execution of manifest files:
+
+       >>> d = tempfile.mkdtemp()
+       >>> for name in ('a','b','c'):
+       ...     open(os.path.join(d,name+'.txt'),'w').write('Doc *%s*\\n' % name)
+       >>> manifest = os.path.join(d,'docs.list')
+       >>> open(manifest,'w').write('# Documents.\\na.txt\\n\\nb.txt\\nmissing.txt\\n')
+       >>> files = read_manifest(manifest)
+       >>> [os.path.relpath(f,d) for f in files]
+       ['a.txt', 'b.txt', 'missing.txt']
+       >>> opts = [('--no-header-footer',None),('--backend','html5')]
+       >>> [(os.path.relpath(f,d),status) for f,status in
+       ...     execute_many(__file__, opts, files)]
+       [('a.txt', 0), ('b.txt', 0), ('missing.txt', 1)]
+       >>> open(os.path.join(d,'b.html')).read()
+       '<div class="paragraph"><p>Doc <strong>b</strong></p></div>\\r\\n'
+       >>> execute_many(__file__, opts + [('--out-file','x.html')], files)
+       Traceback (most recent call last):
+       EAsciiDoc: --out-file option not allowed in batch mode
+       >>> shutil.rmtree(d)
+
+    2. Check parallel execution:
+
+       >>> d = tempfile.mkdtemp()
+       >>> files = []
+       >>> for name in ('a','b','c','d'):
+       ...     files.append(os.path.join(d,name+'.txt'))
+       ...     open(files[-1],'w').write('Doc *%s*\\n' % name)
+       >>> opts = [('--no-header-footer',None),('--backend','html5')]
+       >>> [(os.path.basename(f),status) for f,status in
+       ...     execute_many(__file__, opts, files, jobs=2)]
+       [('a.txt', 0), ('b.txt', 0), ('c.txt', 0), ('d.txt', 0)]
+       >>> open(os.path.join(d,'d.html')).read()
+       '<div class="paragraph"><p>Doc <strong>d</strong></p></div>\\r\\n'
+       >>> shutil.rmtree(d)
+
+    """
+    deps_file = None
+    for o,v in opts:
+        if o in ('-o','--out-file'):
+            raise EAsciiDoc,'--out-file option not allowed in batch mode'
+        if o == '--deps':
+            deps_file = v
+    if deps_file:
+        # The dependencies of all the documents are written to deps_file.
+        opts = [(o,v) for o,v in opts if o != '--deps']
+        deps = []
+    else:
+        deps = None
+    for infile in args:
+        if infile == '-':
+            raise EAsciiDoc,'stdin input not allowed in batch mode'
+    jobs = min(jobs, len(args))
+    if jobs > 1:
+        try:
+            import multiprocessing
+        except ImportError:
+            message.verbose('multiprocessing not available: --jobs ignored',
+                    False)
+            jobs = 1
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, _init_worker)
+        try:
+            result = pool.map(_execute_job,
+                    [(cmd,opts,infile,deps) for infile in args], 1)
+            pool.close()
+        except:
+            pool.terminate()
+            pool.join()
+            raise
+        pool.join()
+        if deps is not None:
+            for r in result:
+                deps += r[2]
+        result = [r[:2] for r in result]
+    else:
+        in_memory = ConfigCache.in_memory
+        ConfigCache.in_memory = True
+        result = []
+        try:
+            for infile in args:
+                result.append(execute_one(cmd,opts,infile,deps))
+        finally:
+            ConfigCache.in_memory = in_memory
+    if deps_file:
+        write_deps(deps_file, deps)
+    return result
+
+def write_deps(fname, deps):
+    """
+    Write the list of (outfile, dependencies) tuples deps to file fname as
+    Makefile rules (plus an empty rule for each dependency), or as a JSON
+    object (keyed by output file) if fname has a .json file name extension.
+
+    Doctests:
+
+    1. Check Makefile and JSON dependencies files:
+
+       >>> d = tempfile.mkdtemp()
+       >>> fname = os.path.join(d,'deps.mk')
+       >>> write_deps(fname, [('out.html', ['a.txt','my dir/b$.txt'])])
+       >>> print open(fname).read()
+       out.html: \\
+         a.txt \\
+         my\\ dir/b$$.txt
+       <BLANKLINE>
+       a.txt:
+       my\\ dir/b$$.txt:
+       <BLANKLINE>
+       >>> write_deps(fname + '.json', [('out.html', ['a.txt'])])
+       >>> print open(fname + '.json').read()
+       {
+         "out.html": [
+           "a.txt"
+         ]
+       }
+       <BLANKLINE>
+       >>> infile = os.path.join(d,'doc.txt')
+       >>> open(os.path.join(d,'part.txt'),'w').write('Part\\n')
+       >>> open(infile,'w').write('include::part.txt[]\\n\\ninclude::none.txt[]\\n')
+       >>> deps = []
+       >>> execute_one(__file__, [('--backend','html5')], infile, deps)[1]
+       0
+       >>> [(os.path.relpath(o,d), [os.path.relpath(f,d) for f in files
+       ...     if f.startswith(d)]) for o,files in deps]
+       [('doc.html', ['doc.txt', 'part.txt'])]
+       >>> [f for f in deps[0][1] if f.endswith('html5.conf')] != []
+       True
+       >>> shutil.rmtree(d)
+
+    """
+    if os.path.splitext(fname)[1].lower() == '.json':
+        try:
+            import json
+        except ImportError:
+            raise EAsciiDoc,'JSON dependencies file requires Python 2.6 or later'
+        d = {}
+        for outfile,files in deps:
+            d[outfile] = files
+        data = json.dumps(d, indent=2, sort_keys=True,
+                separators=(',',': ')) + '\n'
+    else:
+        def escape(s):
+            s = s.replace('$','$$').replace('#','\\#')
+            return re.sub(r'([ \t])', r'\\\1', s)
+        lines = []
+        targets = []
+        for outfile,files in deps:
+            lines.append(escape(outfile) + ':' +
+                    ''.join([' \\\n  ' + escape(f) for f in files]) + '\n')
+            for f in files:
+                if f not in targets:
+                    targets.append(f)
+        # Empty rules so make doesn't fail if a dependency is deleted.
+        lines.append(''.join([escape(f) + ':\n' for f in targets]))
+        data = '\n'.join(lines)
+    f = open(fname,'wb')
+    try:
+        f.write(data)
+    finally:
+        f.close()
+
+def read_manifest(fname):
+    """
+    Return the list of source file names in manifest file fname (one file
+    name per line, blank lines and lines starting with # are skipped).
+    Relative file names are relative to the manifest file directory.
+    """
+    result = []
+    f = open(fname)
+    try:
+        for s in f:
+            s = s.strip()
+            if s and s[0] != '#':
+                result.append(os.path.join(os.path.dirname(fname), s))
+    finally:
+        f.close()
+    return result
+
+# Serializes convert() calls (the processing state is global).
+convert_lock = threading.Lock()
+
+def convert(text, backend=None, doctype=None, attributes={}, options=[]):
+    """
+    Convert AsciiDoc source text and return an (output, messages) tuple.
+    The output is returned as a unicode string if text is a unicode string.
+    messages is a list of (severity, file name, line number, text) tuples,
+    severity is one of 'WARNING', 'DEPRECATED', 'ERROR' or 'FAILED'.
+
+    Document attributes are set using the attributes dictionary (a None
+    value undefines the attribute). options is a list of (name, value)
+    command-line option tuples e.g. [('--no-header-footer',None)].
+
+    Raises EAsciiDoc if the conversion failed.
+
+    Calls are serialized so it is safe to call convert() from multiple
+    threads (but not concurrently with execute()). Conversions run in the
+    default unsafe mode unless the --safe option is included in options.
+
+    >>> output,messages = convert('Hello *{name}*', backend='html4',
+    ...     attributes={'name':'Joe'}, options=[('-s',None)])
+    >>> print output
+    <p>Hello <strong>Joe</strong></p>
+    >>> messages
+    []
+
+    In safe mode source text can't include files (there is no source file
+    directory to confine them to):
+
+    >>> output,messages = convert('include::/etc/passwd[]',
+    ...     options=[('--safe',None),('-s',None)])
+    >>> output
+    ''
+    >>> messages
+    [('ERROR', '<stdin>', 1, 'unsafe: include file: /etc/passwd')]
+
+    """
+    opts = list(options)
+    if backend is not None:
+        opts.append(('--backend',backend))
+    if doctype is not None:
+        opts.append(('--doctype',doctype))
+    for k,v in attributes.items():
+        if v == '' or k[-1] in '!@':
+            s = k
+        elif v is None: # A None value undefines the attribute.
+            s = k + '!'
+        else:
+            s = '%s=%s' % (k,v)
+        opts.append(('--attribute',s))
+    encoding = None
+    if isinstance(text, unicode):
+        encoding = attributes.get('encoding') or 'UTF-8'
+        text = text.encode(encoding)
+    infile,outfile = StringIO(text),StringIO()
+    opts.append(('--out-file',outfile))
+    convert_lock.acquire()
+    try:
+        in_memory = ConfigCache.in_memory
+        ConfigCache.in_memory = True
+        try:
+            reset_asciidoc()
+            try:
+                execute(APP_FILE or __file__, opts, [infile])
+            except SystemExit:
+                pass
+            records = message.records[:]
+        finally:
+            ConfigCache.in_memory = in_memory
+            reset_asciidoc()    # Don't leave state from this conversion.
+    finally:
+        convert_lock.release()
+    for record in records:
+        if record[0] == 'FAILED':
+            raise EAsciiDoc, record[3]
+    result = outfile.getvalue()
+    if encoding:
+        result = result.decode(encoding)
+    return (result,records)
+
+def serve(address, opts=[]):
+    """
+    Run an HTTP render server until interrupted. address is a port number,
+    a host:port string or a Unix domain socket file path. Each POST request
+    body is AsciiDoc source which is converted (using convert()) and
+    returned as the response body. The backend, doctype and attribute
+    request query parameters set the corresponding command-line options.
+    opts are default command-line options for all requests. Requests are
+    converted in safe mode (include files and system macros are refused)
+    unless opts contains the --unsafe option: a port number is only served
+    on the loopback interface, but any web page open in a local browser
+    can POST to it.
+    Configuration files are cached in memory between requests.
+    """
+    import BaseHTTPServer, SocketServer, urlparse, cgi, stat
+    if '--unsafe' not in [o for o,v in opts]:
+        # Request bodies are untrusted (any web page can POST to the server).
+        opts = list(opts) + [('--safe',None)]
+    class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        server_version = 'asciidoc/' + VERSION
+        def address_string(self):
+            if isinstance(self.client_address, tuple):
+                return self.client_address[0]
+            return address     # Unix domain socket.
+        def log_message(self, format, *args):
+            message.verbose(format % args, False)
+        def do_POST(self):
+            query = cgi.parse_qs(urlparse.urlparse(self.path)[4])
+            backend = query.get('backend',[None])[-1]
+            doctype = query.get('doctype',[None])[-1]
+            options = list(opts)
+            for v in query.get('attribute',[]):
+                options.append(('--attribute',v))
+            try:
+                length = int(self.headers.get('Content-Length',0))
+                if length < 0:
+                    raise ValueError
+            except ValueError:
+                self.send_error(400, 'illegal Content-Length')
+                return
+            text = self.rfile.read(length)
+            try:
+                output,records = convert(text, backend, doctype,
+                                         options=options)
+                status = 200
+                if backend and backend.startswith('docbook'):
+                    content_type = 'application/xml'
+                else:
+                    content_type = 'text/html'
+            except EAsciiDoc,e:
+                output,records = str(e),[]
+                status = 500
+                content_type = 'text/plain'
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(output)))
+            for severity,fname,lineno,msg in records:
+                if lineno is not None:
+                    msg = 'line %d: %s' % (lineno,msg)
+                msg = re.sub(r'[\r\n]+', ' ', msg)
+                self.send_header('X-AsciiDoc-Message',
+                                 '%s: %s' % (severity,msg))
+            self.end_headers()
+            self.wfile.write(output)
+    if address.isdigit() or ':' in address:
+        host,port = (':' + address).split(':')[-2:]
+        if not port.isdigit():
+            raise EAsciiDoc,'illegal server address: %s' % address
+        server = BaseHTTPServer.HTTPServer((host or '127.0.0.1',int(port)),
+                                           RequestHandler)
+    else:
+        if not hasattr(SocketServer, 'UnixStreamServer'):
+            raise EAsciiDoc,'Unix domain sockets are not supported'
+        # Remove a socket left by a previous server (but not other files).
+        if os.path.exists(address) and \
+                stat.S_ISSOCK(os.stat(address).st_mode):
+            os.unlink(address)
+        class UnixHTTPServer(SocketServer.UnixStreamServer):
+            def server_bind(self):
+                SocketServer.UnixStreamServer.server_bind(self)
+                self.server_name,self.server_port = 'localhost',0
+        server = UnixHTTPServer(address, RequestHandler)
+    message.stderr('serving on %s' % address)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if not isinstance(server.server_address, tuple):
+            os.unlink(address)
+
+class Inotify:
+    """
+    Linux inotify(7) directory watcher (uses ctypes). Raises EnvironmentError
+    if inotify is not available.
+    """
+    # IN_MODIFY|IN_ATTRIB|IN_CLOSE_WRITE|IN_MOVED_FROM|IN_MOVED_TO|IN_CREATE|
+    # IN_DELETE event mask.
+    MASK = 0x002|0x004|0x008|0x040|0x080|0x100|0x200
+    def __init__(self):
+        try:
+            import ctypes, ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6')
+            self.add_watch = libc.inotify_add_watch
+            self.fd = libc.inotify_init()
+        except (ImportError, OSError, AttributeError):
+            raise EnvironmentError,'inotify not available'
+        if self.fd < 0:
+            raise EnvironmentError,'inotify_init failed'
+        self.dirs = set()   # Watched directories.
+    def watch(self, d):
+        """Watch directory d (ignored if d does not exist)."""
+        if d not in self.dirs and os.path.isdir(d):
+            if self.add_watch(self.fd, d, self.MASK) >= 0:
+                self.dirs.add(d)
+    def wait(self, timeout=None):
+        """Wait up to timeout seconds for changes in the watched
+        directories. Return True if there were changes."""
+        import select
+        if not select.select([self.fd],[],[],timeout)[0]:
+            return False
+        # Let pending events (e.g. editor writes and renames) arrive before
+        # discarding them.
+        while select.select([self.fd],[],[],0.1)[0]:
+            os.read(self.fd, 65536)
+        return True
+
+def execute_watched(cmd, opts, infile):
+    """
+    Reset the global processing state then execute asciidoc for source file
+    infile. Returns the (status, files) tuple where files lists the source
+    file, its dependencies and the dependencies that were looked for but not
+    found i.e. the files that watch() watches.
+
+    Doctests:
+
+    1. Check missing include files are watched:
+
+       >>> d = tempfile.mkdtemp()
+       >>> infile = os.path.join(d,'doc.txt')
+       >>> open(os.path.join(d,'part.txt'),'w').write('Part\\n')
+       >>> open(infile,'w').write('include::part.txt[]\\n\\ninclude::new.txt[]\\n')
+       >>> opts = [('--cache-dir',os.path.join(d,'cache')),('--incremental',None),
+       ...         ('--backend','html5')]
+       >>> def watched():
+       ...     status,files = execute_watched(__file__, opts, infile)
+       ...     return status, [os.path.relpath(f,d) for f in files
+       ...                     if f.endswith('.txt')]
+       >>> watched()
+       (0, ['doc.txt', 'doc.txt', 'part.txt', 'new.txt'])
+       >>> watched()       # Skipped by --incremental: same files are watched.
+       (0, ['doc.txt', 'doc.txt', 'part.txt', 'new.txt'])
+       >>> open(os.path.join(d,'new.txt'),'w').write('New\\n')
+       >>> watched()       # Translated again: new.txt is now a dependency.
+       (0, ['doc.txt', 'doc.txt', 'part.txt', 'new.txt'])
+       >>> 'New' in open(os.path.join(d,'doc.html')).read()
+       True
+       >>> shutil.rmtree(d)
+
+    """
+    reset_asciidoc()
+    deps = document.deps = []   # Kept if the translation fails.
+    try:
+        execute(cmd,opts,[infile])
+        status = 0
+    except SystemExit,e:
+        status = e.code or 0
+    if document.deps:
+        deps = document.deps    # Restored by --incremental.
+    return (status, [os.path.abspath(infile)] + deps + document.missing)
+
+def watch(cmd, opts, args, interval=1.0):
+    """
+    Execute asciidoc with command-line options opts for each source file in
+    args then watch the files each document depends on (see Document.depend())
+    and execute asciidoc again for documents whose files change. Changes are
+    detected with inotify (Linux) or by polling every interval seconds.
+    Processed configuration and include files are cached in memory. Runs
+    until interrupted.
+    """
+    def signature(fname):
+        try:
+            st = os.stat(fname)
+            return (st.st_mtime, st.st_size)
+        except OSError:
+            return None
+    docs = {}   # File signatures dictionaries keyed by source file.
+    def translate(infile):
+        status,files = execute_watched(cmd,opts,infile)
+        sigs = {}
+        for f in files:
+            sigs[f] = signature(f)
+        docs[infile] = sigs
+        message.stdout('%d %s' % (status,infile))
+        sys.stdout.flush()
+    for o,v in opts:
+        if o in ('-o','--out-file','--deps') and len(args) > 1:
+            raise EAsciiDoc,'%s option not allowed with multiple files' % o
+    for infile in args:
+        if infile == '-':
+            raise EAsciiDoc,'stdin input not allowed in watch mode'
+    ConfigCache.in_memory = True
+    try:
+        inotify = Inotify()
+    except EnvironmentError,e:
+        inotify = None
+    for infile in args:
+        translate(infile)
+    while True:
+        if inotify:
+            for sigs in docs.values():
+                for f in sigs:
+                    inotify.watch(os.path.dirname(f))
+            # Missing files in unwatched directories are polled occasionally.
+            inotify.wait(interval*10)
+        else:
+            time.sleep(interval)
+        for infile in args:
+            for f,sig in docs[infile].items():
+                if signature(f) != sig:
+                    translate(infile)
+                    break
 
 if __name__ == '__main__':
     # Process command line options.
@@ -6219,7 +8234,9 @@ if __name__ == '__main__':
             ['attribute=','backend=','conf-file=','doctype=','dump-conf',
             'help','no-conf','no-header-footer','out-file=',
             'section-numbers','verbose','version','safe','unsafe',
-            'doctest','filter=','theme='])
+            'doctest','filter=','theme=','cache-dir=','batch',
+            'manifest=','jobs=','serve=','atomic','if-changed','deps=',
+            'incremental','watch'])
     except getopt.GetoptError:
         message.stderr('illegal command options')
         sys.exit(1)
@@ -6257,6 +8274,74 @@ if __name__ == '__main__':
         config.init(sys.argv[0])
         config.verbose = bool(set(['-v','--verbose']) & set(opt_names))
         getattr(Plugin,cmd)(args)
+    elif '--serve' in opt_names:
+        # Run render server.
+        address = [v for o,v in opts if o == '--serve'][-1]
+        opts = [(o,v) for o,v in opts if o != '--serve']
+        if args:
+            die('source files not allowed in server mode')
+        if set(['-o','--out-file']) & set(opt_names):
+            die('--out-file option not allowed in server mode')
+        config.init(sys.argv[0])
+        def terminate(signum, frame):
+            raise KeyboardInterrupt
+        import signal
+        signal.signal(signal.SIGTERM, terminate)
+        try:
+            serve(address, opts)
+        except KeyboardInterrupt:
+            pass
+        except EAsciiDoc,e:
+            die(str(e))
+        except EnvironmentError,e:
+            die('server failed: %s' % e)
+    elif '--watch' in opt_names:
+        # Translate source files and re-translate them when they change.
+        if set(['--batch','--manifest','--jobs']) & set(opt_names):
+            die('--watch option cannot be used with batch mode options')
+        if not args:
+            die('no source files specified')
+        opts = [(o,v) for o,v in opts if o != '--watch']
+        def terminate(signum, frame):
+            raise KeyboardInterrupt
+        import signal
+        signal.signal(signal.SIGTERM, terminate)
+        try:
+            watch(sys.argv[0], opts, args)
+        except KeyboardInterrupt:
+            pass
+        except EAsciiDoc,e:
+            die(str(e))
+    elif set(['--batch','--manifest','--jobs']) & set(opt_names):
+        # Execute asciidoc for each source file.
+        try:
+            jobs = 1
+            for o,v in opts:
+                if o == '--manifest':
+                    if not os.path.isfile(v):
+                        die('missing manifest file: %s' % v)
+                    args += read_manifest(v)
+                if o == '--jobs':
+                    try:
+                        jobs = int(v)
+                        if jobs < 1:
+                            raise ValueError
+                    except ValueError:
+                        die('illegal --jobs option: %s' % v)
+            if not args:
+                die('no source files specified')
+            opts = [(o,v) for o,v in opts
+                    if o not in ('--batch','--manifest','--jobs')]
+            try:
+                results = execute_many(sys.argv[0],opts,args,jobs)
+            except EAsciiDoc,e:
+                die(str(e))
+            for infile,status in results:
+                message.stdout('%d %s' % (status,infile))
+            if [status for infile,status in results if status]:
+                sys.exit(1)
+        except KeyboardInterrupt:
+            sys.exit(1)
     else:
         # Execute asciidoc.
         try:
@@ -46,6 +46,18 @@ Doctests:
        raise AsciiDocError(self.messages[-1])
    AsciiDocError: ERROR: <stdin>: line 1: [blockdef-listing] missing closing delimiter
 
+3. Check string conversion:
+
+   >>> asciidoc = AsciiDocAPI()
+   >>> asciidoc.options('--no-header-footer')
+   >>> print asciidoc.convert('Hello *world*', backend='html4')
+   <p>Hello <strong>world</strong></p>
+   >>> output = asciidoc.convert('----\\nHello')
+   >>> asciidoc.records
+   [('ERROR', '<stdin>', 2, '[blockdef-listing] missing closing delimiter')]
+   >>> asciidoc.messages
+   ['ERROR: <stdin>: line 2: [blockdef-listing] missing closing delimiter']
+
 
 Copyright (C) 2009 Stuart Rackham. Free use of this software is granted
 under the terms of the GNU General Public License (GPL).
@@ -153,6 +165,7 @@ class AsciiDocAPI(object):
         self.options = Options()
         self.attributes = {}
         self.messages = []
+        self.records = []
         # Search for the asciidoc command file.
         # Try ASCIIDOC_PY environment variable first.
         cmd = os.environ.get('ASCIIDOC_PY')
@@ -177,6 +190,9 @@ class AsciiDocAPI(object):
                     raise AsciiDocError('failed to locate asciidoc')
         self.cmd = os.path.realpath(cmd)
         self.__import_asciidoc()
+        if hasattr(self.asciidoc, 'ConfigCache'):
+            # Only read configuration files once per process.
+            self.asciidoc.ConfigCache.in_memory = True
 
     def __import_asciidoc(self, reload=False):
         '''
@@ -236,8 +252,12 @@ class AsciiDocAPI(object):
         args = [infile]
         # The AsciiDoc command was designed to process source text then
         # exit, there are globals and statics in asciidoc.py that have
-        # to be reinitialized before each run -- hence the reload.
-        self.__import_asciidoc(reload=True)
+        # to be reinitialized before each run -- older versions of
+        # asciidoc.py have to be reloaded.
+        if hasattr(self.asciidoc, 'reset_asciidoc'):
+            self.asciidoc.reset_asciidoc()
+        else:
+            self.__import_asciidoc(reload=True)
         try:
             try:
                 self.asciidoc.execute(self.cmd, opts.values, args)
@@ -247,6 +267,31 @@ class AsciiDocAPI(object):
             if e.code:
                 raise AsciiDocError(self.messages[-1])
 
+    def convert(self, text, backend=None):
+        """
+        Convert AsciiDoc source text (a str or unicode string) to backend
+        format and return the output text. stdin, stdout and temporary files
+        are not used. Unless the --safe option is set include macros and
+        system macros in text are processed (in safe mode they are refused).
+        The messages and records attributes are set, so threads should not
+        share an AsciiDocAPI instance.
+        """
+        self.messages = []
+        self.records = []
+        if not hasattr(self.asciidoc, 'convert'):
+            raise AsciiDocError('asciidoc %s does not support convert()'
+                % self.asciidoc.VERSION)
+        try:
+            output,self.records = self.asciidoc.convert(text, backend,
+                attributes=self.attributes, options=self.options.values)
+        except self.asciidoc.EAsciiDoc, e:
+            raise AsciiDocError(str(e))
+        for severity,fname,lineno,msg in self.records:
+            if lineno is not None:
+                msg = '%s: line %d: %s' % (os.path.basename(fname),lineno,msg)
+            self.messages.append('%s: %s' % (severity,msg))
+        return output
+
 
 if __name__ == "__main__":
     """